@@ -0,0 +1,201 @@
+'''
+flask_query_profiler
+    Per-request SQL statistics for Flask + SQLAlchemy apps.
+
+    profiler = QueryProfiler(app)
+
+    - counts the statements each request runs and the time spent in the db
+    - flags statements repeated within one request (the N+1 pattern)
+    - adds a Server-Timing header to every response that isn't streamed; a
+      streamed body runs its queries after the headers are sent, so its counts
+      (here and on the dashboard) only cover the work done before streaming
+    - serves recent requests at /__perf when the app is in debug/testing mode
+    - profiler.budget(n) fails a test when a request runs more than n statements
+'''
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, jsonify, render_template_string, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+__all__ = ['QueryProfiler', 'QueryBudgetExceeded', 'RequestProfile']
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestProfile(object):
+    def __init__(self, method, path, endpoint):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.status = None
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def duplicates(self, threshold):
+        # statements run <threshold> or more times; same SQL text means same query with other params
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+    def as_dict(self, threshold):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'total_ms': round(self.duration * 1000, 2),
+            'duplicates': [{'statement': s, 'count': n} for s, n in self.duplicates(threshold)],
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_profiler_start'].pop()
+    # only statements run on behalf of a request are attributed; worker threads are not
+    if has_request_context():
+        profile = g.get('query_profile')
+        if profile is not None:
+            profile.db_time += time.perf_counter() - started
+            profile.statements[statement] += 1
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    starts = exception_context.connection.info.get('query_profiler_start') if exception_context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def _listen():
+    # once per process, for every engine; requests without a profile are ignored
+    global _listening
+    with _listening_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            _listening = True
+
+
+DASHBOARD = '''<!doctype html>
+<title>Query profile</title>
+<style>body{font:14px sans-serif} td,th{padding:2px 8px;text-align:left;vertical-align:top} .warn{color:#b00} pre{margin:0;white-space:pre-wrap}</style>
+<h1>Last {{ profiles|length }} requests</h1>
+<table>
+<tr><th>request</th><th>status</th><th>queries</th><th>db ms</th><th>total ms</th><th>repeated statements</th></tr>
+{% for p in profiles %}
+<tr{% if p.duplicates or (budget and p.queries > budget) %} class="warn"{% endif %}>
+<td>{{ p.method }} {{ p.path }}</td><td>{{ p.status }}</td><td>{{ p.queries }}</td><td>{{ p.db_ms }}</td><td>{{ p.total_ms }}</td>
+<td>{% for d in p.duplicates %}<pre>{{ d.count }} &times; {{ d.statement }}</pre>{% endfor %}</td>
+</tr>
+{% endfor %}
+</table>
+'''
+
+
+class QueryProfiler(object):
+    def __init__(self, app=None):
+        self.history = deque()
+        self._lock = threading.Lock()
+        self._watchers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PROFILER_HISTORY', 200)
+        # repeats of one statement within a request that count as an N+1 loop
+        app.config.setdefault('QUERY_PROFILER_REPEAT_THRESHOLD', 3)
+        # statements per request above which the dashboard highlights a request
+        app.config.setdefault('QUERY_PROFILER_BUDGET', None)
+        # None: dashboard only in debug or testing mode
+        app.config.setdefault('QUERY_PROFILER_DASHBOARD', None)
+        self.history = deque(maxlen=app.config['QUERY_PROFILER_HISTORY'])
+
+        _listen()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/__perf', 'query_profiler_dashboard', self.dashboard)
+        app.extensions['query_profiler'] = self
+
+    def _start(self):
+        g.query_profile = RequestProfile(request.method, request.full_path.rstrip('?'), request.endpoint)
+
+    def _finish(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None or request.endpoint == 'query_profiler_dashboard':
+            return response
+        profile.duration = time.perf_counter() - profile.started
+        profile.status = response.status_code
+
+        if not response.is_streamed:
+            response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (profile.db_time * 1000, profile.count))
+            response.headers.add('Server-Timing', 'app;dur=%.2f' % (profile.duration * 1000))
+
+        threshold = current_app.config['QUERY_PROFILER_REPEAT_THRESHOLD']
+        for statement, n in profile.duplicates(threshold):
+            current_app.logger.warning('possible N+1 in %s: %d x %s', profile.endpoint, n, statement.split('\n')[0])
+
+        with self._lock:
+            self.history.append(profile)
+            for watcher in self._watchers:
+                watcher.append(profile)
+        return response
+
+    def dashboard(self):
+        enabled = current_app.config['QUERY_PROFILER_DASHBOARD']
+        if enabled is None:
+            enabled = current_app.debug or current_app.testing
+        if not enabled:
+            return 'Not Found', 404
+
+        threshold = current_app.config['QUERY_PROFILER_REPEAT_THRESHOLD']
+        with self._lock:
+            profiles = [p.as_dict(threshold) for p in reversed(self.history)]
+        if request.args.get('format') == 'json':
+            return jsonify({'profiles': profiles})
+        return render_template_string(DASHBOARD, profiles=profiles, budget=current_app.config['QUERY_PROFILER_BUDGET'])
+
+    @contextmanager
+    def record(self):
+        # collects the profiles of requests finished inside the block
+        profiles = []
+        with self._lock:
+            self._watchers.append(profiles)
+        try:
+            yield profiles
+        finally:
+            with self._lock:
+                self._watchers.remove(profiles)
+
+    @contextmanager
+    def budget(self, max_queries):
+        '''
+        with profiler.budget(3):
+            client.get('/venues/1')
+        raises QueryBudgetExceeded if any request inside ran more than max_queries statements
+        '''
+        with self.record() as profiles:
+            yield profiles
+        over = [p for p in profiles if p.count > max_queries]
+        if over:
+            raise QueryBudgetExceeded('; '.join(
+                '%s %s ran %d queries (budget %d)' % (p.method, p.path, p.count, max_queries) for p in over))
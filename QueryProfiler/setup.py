@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='Flask-Query-Profiler',
+    version='0.1.0',
+    description='Per-request SQL statement counts, timings and N+1 detection for Flask-SQLAlchemy apps',
+    py_modules=['flask_query_profiler'],
+    install_requires=['Flask>=1.0', 'SQLAlchemy>=1.3'],
+)
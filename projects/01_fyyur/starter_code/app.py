@@ -4,36 +4,127 @@
 
 import json
 import dateutil.parser
-import babel
+import functools
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort
+import threading
+import time
+import click
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context, g, session, make_response, has_request_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import TrigramIndex, similarity
 from flask_migrate import Migrate
-from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from datetime import datetime, timedelta
+from enums import Genre
+import formatting
+from cache import PageCache, backend_from_url
+from jsonstream import stream_listing, encoder as json_encoder
+from scheduling import BookingIndex, ScheduleConflict
+from dbpool import engine_options, pool_status
+try:
+  from flask_query_profiler import QueryProfiler
+except ImportError:
+  # optional, see /QueryProfiler
+  QueryProfiler = None
+from importer import FORMATS, ImportReport, batched, read_rows, split_list, text_stream
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///postgres'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+class RoutingSession(SignallingSession):
+  # GET/HEAD requests read from the replica bind when one is configured; flushes always go to the primary,
+  # and so do requests that set g.read_primary and, for a while after a write, that client's requests
+  # (see pin_reads_to_primary)
+  def __init__(self, db, **options):
+    self.db = db
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing and 'replica' in (self.app.config['SQLALCHEMY_BINDS'] or {}) \
+        and has_request_context() and request.method in ('GET', 'HEAD') and not g.get('read_primary') \
+        and session.get('read_primary_until', 0) < time.time():
+      return self.db.get_engine(self.app, bind='replica')
+    return SignallingSession.get_bind(self, mapper, clause)
+
+  def commit(self):
+    SignallingSession.commit(self)
+    if has_request_context() and request.method not in ('GET', 'HEAD'):
+      g.wrote_primary = True
+
+class Database(SQLAlchemy):
+  def apply_driver_hacks(self, app, sa_url, options):
+    # pool sizing, pre-ping and statement timeout from config, see dbpool.engine_options()
+    # Flask-SQLAlchemy 2.5 returns (sa_url, options); 2.4 changed options in place and returned None
+    result = SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+    if result is not None:
+      sa_url, options = result
+    options.update(engine_options(app.config, sa_url))
+    return sa_url, options
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+moment = Moment()
+db = Database()
+migrate = Migrate()
+
+def create_app(settings=None):
+  # config.py, then the file named by $FYYUR_SETTINGS, then <settings>.
+  # The routes below are registered on the module level app this builds.
+  app = Flask(__name__)
+  app.config.from_object('config')
+  app.config.from_envvar('FYYUR_SETTINGS', silent=True)
+  if settings:
+    app.config.update(settings)
+  if app.config.get('DATABASE_REPLICA_URL'):
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, replica=app.config['DATABASE_REPLICA_URL'])
+
+  moment.init_app(app)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  if QueryProfiler is not None and app.config['QUERY_PROFILER']:
+    QueryProfiler(app)
+  return app
+
+app = create_app()
+
+@app.after_request
+def pin_reads_to_primary(response):
+  # the page a create/edit redirects to, and whatever the client reads next, must not come from
+  # a replica that has not replayed the write yet
+  if g.get('wrote_primary') and app.config['READ_PRIMARY_AFTER_WRITE']:
+    session['read_primary_until'] = time.time() + app.config['READ_PRIMARY_AFTER_WRITE']
+  return response
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# the trigram indexes' operator class, for db.create_all(); the migrations create it themselves
+db.event.listen(db.Model.metadata, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city', 'id'),
+        db.Index('ix_Venue_genre_mask', 'genre_mask', 'id'),
+        # ILIKE name search in search_by_name(); needs pg_trgm, see above
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # partial, so it only holds the few rows waiting for purge_deleted()
+        db.Index('ix_Venue_deleted_at', 'deleted_at',
+            postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -42,11 +133,18 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    venue_genres = db.relationship('VenueGenre', backref='venue', lazy=True)
+    venue_genres = db.relationship('VenueGenre', backref='venue', lazy=True, cascade='all, delete-orphan')
+    # one bit per enums.Genre, see set_genres()
+    genre_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     seeking_talent = db.Column(db.Boolean, default=False, nullable=True)
     seeking_description= db.Column(db.String(120))
     website = db.Column(db.String(120))
     shows = db.relationship('Show', backref='venue', lazy=True)
+    # counter cache, kept current by create/delete handlers and rollover_shows()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # set by delete_venue(); the row and its shows stay until purge_deleted() runs
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     #def __repr__(self):
     #    return f'<Venue id: {self.id}, name: {self.name}, city: {self.city}>'
@@ -55,10 +153,16 @@ class VenueGenre(db.Model):
     __tablename__ = 'VenueGenre'
     id = db.Column(db.Integer, primary_key=True)
     genre = db.Column(db.String(120), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False, index=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_genre_mask', 'genre_mask', 'id'),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_deleted_at', 'deleted_at',
+            postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -69,36 +173,800 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False, nullable=True)
     seeking_description= db.Column(db.String(120))
-    artist_genres = db.relationship('ArtistGenre', backref='artist', lazy=True)
+    artist_genres = db.relationship('ArtistGenre', backref='artist', lazy=True, cascade='all, delete-orphan')
+    # one bit per enums.Genre, see set_genres()
+    genre_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist', lazy=True)
+    # counter cache, kept current by create/delete handlers and rollover_shows()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # set by delete_artist(); the row and its shows stay until purge_deleted() runs
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
 class ArtistGenre(db.Model):
     __tablename__ = 'ArtistGenre'
     id = db.Column(db.Integer, primary_key=True)
     genre = db.Column(db.String(120), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False, index=True)
+
+class Area(db.Model):
+    # per (city, state) rollup of live venues, kept current by the venue and show writers, see bump_area()
+    __tablename__ = 'Area'
+    __table_args__ = (
+        db.UniqueConstraint('state', 'city', name='uq_Area_state_city'),
+        db.Index('ix_Area_activity', 'num_upcoming_shows', 'num_venues'),
+        db.Index('ix_Area_state_activity', 'state', 'num_upcoming_shows', 'num_venues'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    num_venues = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venues_start_time', 'venues', 'start_time'),
+        db.Index('ix_Show_artists_start_time', 'artists', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_is_past_start_time', 'is_past', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     artists = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venues = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    # which counter this show is currently tallied in (upcoming or past)
+    is_past = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+def set_genres(entity, genres):
+  # genre_mask is what pages and filters read; the per-genre rows are kept in step for joins and reporting
+  entity.genre_mask = Genre.mask(genres)
+  if isinstance(entity, Venue):
+    entity.venue_genres = [VenueGenre(genre=g.name) for g in genres]
+  else:
+    entity.artist_genres = [ArtistGenre(genre=g.name) for g in genres]
+
+def form_genres():
+  return [g for g in (Genre.lookup(label) for label in request.form.getlist('genres')) if g is not None]
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  return formatting.format_datetime(value, format, g.get('locale', app.config['DEFAULT_LOCALE']), g.get('timezone'))
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+@app.before_request
+def select_locale():
+  # locale from Accept-Language, timezone from the 'tz' cookie (e.g. America/New_York)
+  g.locale = request.accept_languages.best_match(app.config['LANGUAGES']) or app.config['DEFAULT_LOCALE']
+  g.timezone = request.cookies.get('tz') or app.config['DISPLAY_TIMEZONE']
+  try:
+    if g.timezone:
+      formatting.timezone(g.timezone)
+  except LookupError:
+    g.timezone = app.config['DISPLAY_TIMEZONE']
+
+def stream_template(template_name, **context):
+  # renders a template chunk by chunk so large listings are sent while they are still being read from the db
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return Response(stream_with_context(stream))
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+page_cache = PageCache(backend_from_url(app.config['PAGE_CACHE_BACKEND'], app.config['PAGE_CACHE_SIZE']))
+
+def cached_page(*scopes):
+  # caches the rendered page under the current versions of its scopes, e.g.
+  # @cached_page('venue:{venue_id}') is dropped by page_cache.invalidate('venue:3')
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      if session.get('_flashes'):
+        # the page would embed one-off flash messages
+        return view(**kwargs)
+
+      key = page_cache.key(request.full_path, [scope.format(**kwargs) for scope in scopes], g.locale, g.timezone)
+      entry = page_cache.get(key)
+      if entry is None:
+        # a lagging replica could store a pre-write page under the version the write just bumped
+        g.read_primary = True
+        response = make_response(view(**kwargs))
+        if response.status_code != 200:
+          return response
+        if response.is_streamed:
+          # keep streaming to this client; the page is cached once fully sent, so the next request gets an ETag
+          response.response = cache_when_sent(key, response.mimetype, response.charset, response.response)
+          return vary_by_locale(response)
+        etag = page_cache.set(key, response.mimetype, response.get_data())
+      else:
+        etag, mimetype, body = entry
+        response = Response(body, mimetype=mimetype)
+
+      response.set_etag(etag)
+      response.headers['Cache-Control'] = 'public, no-cache'
+      return vary_by_locale(response).make_conditional(request)
+    return wrapper
+  return decorator
+
+def cache_when_sent(key, mimetype, charset, chunks):
+  # passes a streamed body through and stores it only if it was sent to the end
+  sent = []
+  for chunk in chunks:
+    sent.append(chunk if isinstance(chunk, bytes) else chunk.encode(charset))
+    yield chunk
+  page_cache.set(key, mimetype, b''.join(sent))
+
+def vary_by_locale(response):
+  # the page depends on Accept-Language (locale) and the tz cookie, and so must any shared cache's copy
+  response.vary.add('Accept-Language')
+  response.vary.add('Cookie')
+  return response
+
+def counterpart_scopes(fk, entity_id):
+  # the artist pages a venue appears on (or venue pages an artist appears on) through its shows
+  if fk is Show.venues:
+    other, prefix = Show.artists, 'artist:'
+  else:
+    other, prefix = Show.venues, 'venue:'
+  return [prefix + str(i) for (i,) in db.session.query(other).filter(fk == entity_id).distinct()]
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def live(model):
+  # every read of venues/artists filters out soft-deleted rows
+  return model.deleted_at.is_(None)
+
+def venue_directory():
+  # areas -> venues -> num_upcoming_shows in one query, grouped by (city, state)
+  rows = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count)\
+    .filter(live(Venue))\
+    .order_by(Venue.state, Venue.city, Venue.id)\
+    .yield_per(1000)
+
+  for (city, state), area_rows in groupby(rows, key=lambda r: (r[0], r[1])):
+    yield {
+      'city': city,
+      'state': state,
+      'venues': [{'id': r[2], 'name': r[3], 'num_upcoming_shows': r[4]} for r in area_rows]
+    }
+
+def show_timeline(entity_fk, entity_id, counterpart, prefix):
+  # past and upcoming shows of one venue/artist joined with the other side, in one query ordered by start_time
+  counterpart_fk = Show.artists if counterpart is Artist else Show.venues
+  is_past = Show.start_time < datetime.now()
+  rows = db.session.query(Show.start_time, counterpart.id, counterpart.name, counterpart.image_link, is_past)\
+    .join(counterpart, counterpart_fk == counterpart.id)\
+    .filter(entity_fk == entity_id, live(counterpart))\
+    .order_by(Show.start_time, Show.id)
+  return split_timeline(rows, prefix)
+
+def split_timeline(rows, prefix):
+  # (start_time, counterpart id, name, image_link, is_past) rows -> past_shows, upcoming_shows
+  past_shows = []
+  upcoming_shows = []
+  for start_time, counterpart_id, name, image_link, past in rows:
+    (past_shows if past else upcoming_shows).append({
+      prefix + "_id": counterpart_id,
+      prefix + "_name": name,
+      prefix + "_image_link": image_link,
+      "start_time": start_time
+    })
+  return past_shows, upcoming_shows
+
+# a venue/artist's shows key, and the side its timeline lists
+TIMELINES = {Venue: (Show.venues, Artist, "artist"), Artist: (Show.artists, Venue, "venue")}
+
+def detail_with_timeline(model, entity_id):
+  # the venue/artist row, then only the show columns its page needs; two lean reads measured faster than
+  # one outer join that repeats the whole entity on every show row (see bench_detail_pages.py).
+  # Returns (None, [], []) if not found.
+  entity = model.query.filter(model.id == entity_id, live(model)).first()
+  if entity is None:
+    return None, [], []
+  fk, counterpart, prefix = TIMELINES[model]
+  past_shows, upcoming_shows = show_timeline(fk, entity_id, counterpart, prefix)
+  return entity, past_shows, upcoming_shows
+
+def detail_concurrently(model, entity_id):
+  # detail_with_timeline() with the timeline read on a search_pool thread, its own session and connection,
+  # while this thread reads the row: one round trip of wait instead of two, for a second connection.
+  # The pool thread has no request, so its read goes to the primary even when a replica is set.
+  # CONCURRENT_DETAIL_READS picks it; measure it with bench_detail_pages.py first.
+  fk, counterpart, prefix = TIMELINES[model]
+  timeline = search_pool.submit(in_app_context, show_timeline, fk, entity_id, counterpart, prefix)
+  entity = model.query.filter(model.id == entity_id, live(model)).first()
+  past_shows, upcoming_shows = timeline.result()
+  if entity is None:
+    return None, [], []
+  return entity, past_shows, upcoming_shows
+
+def find_by_genres(model, genres, match='any', limit=50, after=None):
+  # venues/artists having any (or all) of the genres, keyset-paginated on id
+  mask = Genre.mask(genres)
+  bits = model.genre_mask.op('&')(mask)
+  query = db.session.query(model.id, model.name, model.city, model.state, model.genre_mask, model.upcoming_shows_count)\
+    .filter(bits == mask if match == 'all' else bits != 0, live(model))
+  if after is not None:
+    query = query.filter(model.id > after)
+  rows = query.order_by(model.id).limit(limit + 1).all()
+
+  data = [{
+    "id": r[0],
+    "name": r[1],
+    "city": r[2],
+    "state": r[3],
+    "genres": Genre.names(r[4]),
+    "num_upcoming_shows": r[5],
+  } for r in rows[:limit]]
+  next_cursor = data[-1]['id'] if len(rows) > limit else None
+  return data, next_cursor
+
+def encode_show_cursor(start_time, show_id):
+  return '%s_%d' % (start_time.isoformat(), show_id)
+
+def decode_show_cursor(cursor):
+  # raises ValueError('Invalid cursor.') whatever is wrong with it, so the parser's message never reaches the client
+  try:
+    start_time, show_id = cursor.rsplit('_', 1)
+    return dateutil.parser.parse(start_time), int(show_id)
+  except (ValueError, OverflowError):
+    raise ValueError('Invalid cursor.')
+
+def filter_arg(args, name, parse):
+  # parse(args[name]) or None when absent; a fixed message when it does not parse
+  try:
+    return parse(args[name]) if args.get(name) else None
+  except (ValueError, OverflowError):
+    raise ValueError('Invalid %s.' % name)
+
+def show_query(after=None, start=None, end=None, venue_id=None, artist_id=None):
+  # shows joined with venue and artist, ordered for keyset pagination on (start_time, id)
+  query = db.session.query(Show.id, Show.start_time, Show.venues, Venue.name, Show.artists, Artist.name, Artist.image_link)\
+    .join(Venue, Show.venues == Venue.id)\
+    .join(Artist, Show.artists == Artist.id)\
+    .filter(live(Venue), live(Artist))
+  if start is not None:
+    query = query.filter(Show.start_time >= start)
+  if end is not None:
+    query = query.filter(Show.start_time < end)
+  if venue_id is not None:
+    query = query.filter(Show.venues == venue_id)
+  if artist_id is not None:
+    query = query.filter(Show.artists == artist_id)
+  if after is not None:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > after)
+  return query.order_by(Show.start_time, Show.id)
+
+def show_filters(args):
+  # ?after=&from=&to=&venue_id=&artist_id= -> show_query() kwargs; raises ValueError
+  return {
+    'after': decode_show_cursor(args['after']) if args.get('after') else None,
+    'start': filter_arg(args, 'from', dateutil.parser.parse),
+    'end': filter_arg(args, 'to', dateutil.parser.parse),
+    'venue_id': filter_arg(args, 'venue_id', int),
+    'artist_id': filter_arg(args, 'artist_id', int),
+  }
+
+def show_listing(limit, **filters):
+  # one page of shows; one extra row tells us whether there is a next page
+  rows = show_query(**filters).limit(limit + 1).all()
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_show_cursor(rows[-1][1], rows[-1][0])
+
+  shows = [{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time
+  } for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows]
+  return shows, next_cursor
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# only used when the database has no pg_trgm (SQLite test runs); loaded on first search
+search_indexes = {Venue: TrigramIndex(), Artist: TrigramIndex()}
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_by_name(model, term, page=1, per_page=20):
+  # ranked name search; returns (total, [{id, name, num_upcoming_shows}])
+  offset = (page - 1) * per_page
+  if db.engine.dialect.name == 'postgresql':
+    # ILIKE is served by the gin_trgm_ops index, the window count rides along with the page
+    matches = model.query.filter(model.name.ilike('%' + escape_like(term) + '%', escape='\\'), live(model))
+    rows = matches.with_entities(model.id, model.name, model.upcoming_shows_count, db.func.count().over())\
+      .order_by(db.func.similarity(model.name, term).desc(), model.id)\
+      .limit(per_page).offset(offset).all()
+    if rows:
+      total = rows[0][3]
+    else:
+      total = matches.count() if page > 1 else 0
+  else:
+    index = search_indexes[model]
+    if not index.loaded:
+      index.load(db.session.query(model.id, model.name).filter(live(model)))
+    total, ids = index.search(term, per_page, offset)
+    by_id = {r[0]: r for r in db.session.query(model.id, model.name, model.upcoming_shows_count).filter(model.id.in_(ids), live(model))}
+    rows = [by_id[i] for i in ids if i in by_id]
+
+  return total, [{"id": r[0], "name": r[1], "num_upcoming_shows": r[2]} for r in rows]
+
+def search_areas(term, limit):
+  # "City, State" areas matching the term, with their venue and upcoming show totals
+  label = Area.city + ', ' + Area.state
+  rows = db.session.query(Area.city, Area.state, Area.num_venues, Area.num_upcoming_shows)\
+    .filter(label.ilike('%' + escape_like(term) + '%', escape='\\'), Area.num_venues > 0).all()
+  areas = [{
+    "city": city,
+    "state": state,
+    "name": '%s, %s' % (city, state),
+    "num_venues": num_venues,
+    "num_upcoming_shows": int(num_upcoming_shows or 0),
+  } for city, state, num_venues, num_upcoming_shows in rows]
+  areas.sort(key=lambda a: -similarity(a['name'], term))
+  return len(areas), areas[:limit]
+
+search_pool = ThreadPoolExecutor(max_workers=app.config['SEARCH_WORKERS'], thread_name_prefix='search')
+
+def in_app_context(fn, *args):
+  # each pool thread gets its own app context, and with it its own db session
+  with app.app_context():
+    return fn(*args)
+
+def search_everything(term, limit):
+  # venues, artists and areas searched concurrently, merged into one list ranked by similarity
+  futures = {
+    'venue': search_pool.submit(in_app_context, search_by_name, Venue, term, 1, limit),
+    'artist': search_pool.submit(in_app_context, search_by_name, Artist, term, 1, limit),
+    'area': search_pool.submit(in_app_context, search_areas, term, limit),
+  }
+  counts = {}
+  data = []
+  for kind, future in futures.items():
+    counts[kind], hits = future.result()
+    for hit in hits:
+      data.append(dict(hit, type=kind, score=similarity(hit['name'], term)))
+  data.sort(key=lambda hit: -hit['score'])
+  return {"count": sum(counts.values()), "counts": counts, "data": data}
+
+def search_index_put(model, entity_id, name):
+  if search_indexes[model].loaded:
+    search_indexes[model].put(entity_id, name)
+
+def search_index_drop(model, entity_id):
+  if search_indexes[model].loaded:
+    search_indexes[model].drop(entity_id)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+def bump_show_count(model, entity_id, is_past, delta):
+  # updates the counter in sql so concurrent writers don't lose updates
+  column = model.past_shows_count if is_past else model.upcoming_shows_count
+  model.query.filter_by(id=entity_id).update({column: column + delta}, synchronize_session=False)
+  if model is Venue and not is_past:
+    bump_venue_area(entity_id, delta)
+
+def counted_shows(*criterion):
+  # the matching shows that are on the counters: a soft delete takes a show off both sides' counters
+  return Show.query.join(Venue, Venue.id == Show.venues).join(Artist, Artist.id == Show.artists)\
+    .filter(live(Venue), live(Artist), *criterion)
+
+def remove_shows(*criterion):
+  # deletes the matching shows and takes them off their venue and artist counters
+  shows = Show.query.filter(*criterion)
+  counted = counted_shows(*criterion)
+  for model, fk in ((Venue, Show.venues), (Artist, Show.artists)):
+    groups = counted.with_entities(fk, Show.is_past, db.func.count(Show.id)).group_by(fk, Show.is_past).all()
+    for entity_id, is_past, n in groups:
+      bump_show_count(model, entity_id, is_past, -n)
+  return shows.delete(synchronize_session=False)
+
+def rollover_shows(now=None, batch_size=1000):
+  # moves shows whose start_time has passed from the upcoming to the past counters
+  now = now or datetime.now()
+  rolled = 0
+  while True:
+    batch = [r.id for r in Show.query.with_entities(Show.id)
+      .filter(Show.is_past == False, Show.start_time <= now)
+      .order_by(Show.id).limit(batch_size)
+      .with_for_update(skip_locked=True)]
+    if not batch:
+      return rolled
+
+    shows = Show.query.filter(Show.id.in_(batch))
+    scopes = ['venues']
+    for model, fk, prefix in ((Venue, Show.venues, 'venue:'), (Artist, Show.artists, 'artist:')):
+      for entity_id, n in counted_shows(Show.id.in_(batch)).with_entities(fk, db.func.count(Show.id)).group_by(fk).all():
+        model.query.filter_by(id=entity_id).update({
+          model.upcoming_shows_count: model.upcoming_shows_count - n,
+          model.past_shows_count: model.past_shows_count + n,
+        }, synchronize_session=False)
+        if model is Venue:
+          bump_venue_area(entity_id, -n)
+        scopes.append(prefix + str(entity_id))
+    shows.update({Show.is_past: True}, synchronize_session=False)
+    db.session.commit()
+    page_cache.invalidate(*scopes)
+    rolled += len(batch)
+
+def start_periodic(name, job, interval):
+  # runs job() every <interval> seconds on a daemon thread, e.g. start_periodic('show-rollover', rollover_shows, 60)
+  def run():
+    while True:
+      time.sleep(interval)
+      with app.app_context():
+        try:
+          job()
+        except:
+          db.session.rollback()
+          app.logger.exception('%s failed', name)
+
+  thread = threading.Thread(target=run, name=name, daemon=True)
+  thread.start()
+  return thread
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+  # for cron: flask rollover-shows
+  print('%d shows rolled over' % rollover_shows())
+
+#----------------------------------------------------------------------------#
+# Area rollup.
+#----------------------------------------------------------------------------#
+
+def ensure_areas(areas):
+  # creates missing (city, state) rows; a concurrent writer may create the same one, so conflicts are ignored
+  rows = [{'city': city, 'state': state} for city, state in set(areas) if city and state]
+  if not rows:
+    return
+  if db.engine.dialect.name == 'postgresql':
+    from sqlalchemy.dialects.postgresql import insert
+    statement = insert(Area.__table__).on_conflict_do_nothing(index_elements=['state', 'city'])
+  else:
+    statement = Area.__table__.insert().prefix_with('OR IGNORE')
+  db.session.execute(statement, rows)
+
+def bump_area(area, venues=0, upcoming=0):
+  # adds to the counters of one (city, state) in sql, like bump_show_count()
+  city, state = area
+  if venues > 0:
+    ensure_areas([area])
+  Area.query.filter(Area.state == state, Area.city == city).update({
+    Area.num_venues: Area.num_venues + venues,
+    Area.num_upcoming_shows: Area.num_upcoming_shows + upcoming,
+  }, synchronize_session=False)
+
+def bump_venue_area(venue_id, upcoming):
+  # the area is looked up in the same statement; soft-deleted venues are no longer counted in theirs
+  venue_area = db.session.query(Venue.state, Venue.city).filter(Venue.id == venue_id, live(Venue))
+  Area.query.filter(db.tuple_(Area.state, Area.city).in_(venue_area))\
+    .update({Area.num_upcoming_shows: Area.num_upcoming_shows + upcoming}, synchronize_session=False)
+
+def refresh_areas():
+  # rebuilds the rollup from Venue in one statement; the writers keep it current, this repairs drift
+  Area.query.delete(synchronize_session=False)
+  totals = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id), db.func.coalesce(db.func.sum(Venue.upcoming_shows_count), 0))\
+    .filter(live(Venue), Venue.city.isnot(None), Venue.state.isnot(None))\
+    .group_by(Venue.city, Venue.state)
+  db.session.execute(Area.__table__.insert().from_select(['city', 'state', 'num_venues', 'num_upcoming_shows'], totals.statement))
+
+@app.cli.command('refresh-areas')
+def refresh_areas_command():
+  refresh_areas()
+  db.session.commit()
+  print('%d areas' % Area.query.count())
+
+#----------------------------------------------------------------------------#
+# Deletion.
+#----------------------------------------------------------------------------#
+
+# model -> (its Show foreign key, genre model, genre foreign key)
+CASCADES = {
+  Venue: (Show.venues, VenueGenre, VenueGenre.venue_id),
+  Artist: (Show.artists, ArtistGenre, ArtistGenre.artist_id),
+}
+
+def soft_delete(model, entity_id):
+  # hides the venue/artist and, through the live() filters, its shows; the shows are left in place for
+  # purge_deleted() but come off the other side's counters (and the venue's area) now.
+  # Returns the page scopes to invalidate, or None if there was nothing to delete. The caller commits.
+  fk = CASCADES[model][0]
+  # the row lock makes a concurrent delete of the same row wait for our commit and then find it gone;
+  # the conditional UPDATE is the check that counts, so the counters come off once either way
+  columns = (Venue.city, Venue.state, Venue.upcoming_shows_count) if model is Venue else (Artist.id,)
+  entity = db.session.query(*columns).filter(model.id == entity_id, live(model)).with_for_update().first()
+  if entity is None:
+    return None
+  other_model, other_fk = (Artist, Show.artists) if model is Venue else (Venue, Show.venues)
+  # read while the row is still live, counted_shows() skips it afterwards
+  groups = counted_shows(fk == entity_id).with_entities(other_fk, Show.is_past, db.func.count(Show.id))\
+    .group_by(other_fk, Show.is_past).all()
+  deleted = model.query.filter(model.id == entity_id, live(model))\
+    .update({model.deleted_at: datetime.now()}, synchronize_session=False)
+  if deleted != 1:
+    return None
+  if model is Venue:
+    bump_area(entity[:2], venues=-1, upcoming=-entity[2])
+  for other_id, is_past, n in groups:
+    bump_show_count(other_model, other_id, is_past, -n)
+  prefix = 'venue:' if model is Venue else 'artist:'
+  return ['venues', 'artists', 'shows', prefix + str(entity_id)] + counterpart_scopes(fk, entity_id)
+
+def delete_entities(model, ids):
+  # set-based cascade in the caller's transaction: shows (off their counters), genre rows, then the rows themselves
+  fk, genre_model, genre_fk = CASCADES[model]
+  remove_shows(fk.in_(ids))
+  genre_model.query.filter(genre_fk.in_(ids)).delete(synchronize_session=False)
+  return model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+
+def purge_deleted(batch_size=1000):
+  # hard-deletes soft-deleted venues and artists. Their shows go <batch_size> at a time, each batch its own
+  # short transaction, so a venue with years of shows never holds long locks on the Show table.
+  purged = 0
+  for model, (fk, _, _) in CASCADES.items():
+    # oldest first, read through the partial deleted_at index
+    ids = [id for (id,) in db.session.query(model.id).filter(model.deleted_at.isnot(None)).order_by(model.deleted_at)]
+    for entity_id in ids:
+      while True:
+        batch = [id for (id,) in db.session.query(Show.id).filter(fk == entity_id).order_by(Show.id).limit(batch_size)]
+        if not batch:
+          break
+        remove_shows(Show.id.in_(batch))
+        db.session.commit()
+      delete_entities(model, [entity_id])
+      db.session.commit()
+      purged += 1
+    if ids:
+      # the directory shows the other side's upcoming show counters
+      page_cache.invalidate('venues')
+  return purged
+
+@app.cli.command('purge-deleted')
+@click.option('--batch-size', default=1000, show_default=True)
+def purge_deleted_command(batch_size):
+  # for cron: flask purge-deleted
+  print('%d venues and artists purged' % purge_deleted(batch_size))
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+#----------------------------------------------------------------------------#
+
+def insert_shows(records):
+  # executemany insert of {venues, artists, start_time} dicts plus their counter cache; returns the page scopes touched
+  now = datetime.now()
+  rows = []
+  counts = Counter()
+  for record in records:
+    is_past = record['start_time'] <= now
+    rows.append(dict(record, is_past=is_past))
+    counts[(Venue, record['venues'], is_past)] += 1
+    counts[(Artist, record['artists'], is_past)] += 1
+
+  if rows:
+    db.session.execute(Show.__table__.insert(), rows)
+  scopes = {'venues', 'shows'}
+  for (model, entity_id, is_past), n in counts.items():
+    bump_show_count(model, entity_id, is_past, n)
+    scopes.add(('venue:' if model is Venue else 'artist:') + str(entity_id))
+  return scopes
+
+def schedule_shows(records):
+  # inserts all shows or none; the caller commits. Returns (page scopes, {artist id: name}).
+  # Raises ValueError for unknown venues/artists and ScheduleConflict for double bookings.
+  length = timedelta(minutes=app.config['SHOW_LENGTH_MINUTES'])
+  venue_ids = sorted({r['venues'] for r in records})
+  artist_ids = sorted({r['artists'] for r in records})
+
+  # row locks, taken in id order, serialize concurrent bookings of the same venue or artist
+  venues = dict(db.session.query(Venue.id, Venue.name).filter(Venue.id.in_(venue_ids), live(Venue)).order_by(Venue.id).with_for_update())
+  artists = dict(db.session.query(Artist.id, Artist.name).filter(Artist.id.in_(artist_ids), live(Artist)).order_by(Artist.id).with_for_update())
+  unknown = {}
+  if len(venues) < len(venue_ids):
+    unknown['venue_id'] = ['Unknown venue %d' % i for i in venue_ids if i not in venues]
+  if len(artists) < len(artist_ids):
+    unknown['artist_id'] = ['Unknown artist %d' % i for i in artist_ids if i not in artists]
+  if unknown:
+    raise ValueError(unknown)
+
+  # existing bookings near the batch, one range query per side on the (fk, start_time) indexes
+  first = min(r['start_time'] for r in records) - length
+  last = max(r['start_time'] for r in records) + length
+  index = BookingIndex(length)
+  # shows of a soft-deleted counterpart are hidden everywhere, so they don't block a booking either
+  sides = (('venue', Show.venues, venue_ids, Artist, Show.artists), ('artist', Show.artists, artist_ids, Venue, Show.venues))
+  for kind, fk, ids, other, other_fk in sides:
+    nearby = db.session.query(Show.id, fk, Show.start_time)\
+      .join(other, other.id == other_fk)\
+      .filter(fk.in_(ids), Show.start_time > first, Show.start_time < last, live(other))
+    for show_id, entity_id, start_time in nearby:
+      index.add((kind, entity_id), start_time, show_id)
+
+  conflicts = []
+  for n, record in enumerate(records):
+    keys = (('venue', record['venues']), ('artist', record['artists']))
+    for kind, entity_id in keys:
+      clashes = index.overlapping((kind, entity_id), record['start_time'])
+      if clashes:
+        conflicts.append({
+          "show": n,
+          kind + "_id": entity_id,
+          "start_time": record['start_time'].isoformat(),
+          # ids of stored shows, 'show N' for earlier entries of the same batch
+          "conflicts_with": clashes,
+        })
+    for key in keys:
+      index.add(key, record['start_time'], 'show %d' % n)
+  if conflicts:
+    raise ScheduleConflict(conflicts)
+
+  return insert_shows(records), artists
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+IMPORT_KINDS = {
+  # the plain wtforms field sets, so rows validate without a request context (e.g. `flask import`)
+  'venues': (VenueFields, Venue, VenueGenre, 'venue_id',
+    ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'website', 'seeking_talent', 'seeking_description')),
+  'artists': (ArtistFields, Artist, ArtistGenre, 'artist_id',
+    ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website', 'seeking_venue', 'seeking_description')),
+}
+
+def import_formdata(row, skip=()):
+  formdata = MultiDict()
+  for key, value in row.items():
+    if key in skip or value is None or value is False:
+      continue
+    formdata.add(key, 'y' if value is True else str(value))
+  return formdata
+
+def validate_entity_row(kind, row):
+  # same rules as the web forms; returns (column values, genre names) or raises ValueError(errors)
+  form_class, model, genre_model, genre_fk, columns = IMPORT_KINDS[kind]
+  labels = split_list(row.get('genres'))
+  genres = [Genre.lookup(label) for label in labels]
+  unknown = [label for label, genre in zip(labels, genres) if genre is None]
+  if unknown:
+    raise ValueError({'genres': ['Unknown genre %s' % label for label in unknown]})
+
+  formdata = import_formdata(row, skip=('genres',))
+  formdata.setlist('genres', [genre.name for genre in genres])
+  form = form_class(formdata=formdata)
+  if not form.validate():
+    raise ValueError(form.errors)
+  return {column: form.data[column] for column in columns}, [genre.name for genre in genres]
+
+def validate_show_row(row):
+  missing = [key for key in ('venue_id', 'artist_id', 'start_time') if not row.get(key)]
+  if missing:
+    raise ValueError({key: ['This field is required.'] for key in missing})
+  form = ShowFields(formdata=import_formdata(row))
+  if not form.validate():
+    raise ValueError(form.errors)
+  try:
+    return {'venues': int(form.venue_id.data), 'artists': int(form.artist_id.data), 'start_time': form.start_time.data}
+  except ValueError:
+    raise ValueError({'venue_id': ['Expected an integer id.'], 'artist_id': ['Expected an integer id.']})
+
+def reserve_ids(model, n):
+  # ids for a batch up front so child rows can be written with executemany as well
+  if db.engine.dialect.name == 'postgresql':
+    rows = db.session.execute(
+      db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :n)"),
+      {'table': '"%s"' % model.__tablename__, 'n': n})
+    return [r[0] for r in rows]
+  start = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+  return list(range(start, start + n))
+
+def write_entity_batch(kind, records):
+  form_class, model, genre_model, genre_fk, columns = IMPORT_KINDS[kind]
+  entity_rows = []
+  genre_rows = []
+  for entity_id, (values, genres) in zip(reserve_ids(model, len(records)), records):
+    entity_rows.append(dict(values, id=entity_id, genre_mask=Genre.mask(genres)))
+    genre_rows.extend({'genre': genre, genre_fk: entity_id} for genre in genres)
+  db.session.execute(model.__table__.insert(), entity_rows)
+  if genre_rows:
+    db.session.execute(genre_model.__table__.insert(), genre_rows)
+  if model is Venue:
+    for area, n in Counter((row.get('city'), row.get('state')) for row in entity_rows).items():
+      if all(area):
+        bump_area(area, venues=n)
+  return [(row['id'], row['name']) for row in entity_rows]
+
+def write_show_batch(records):
+  # drops shows pointing at unknown venues/artists; returns the dropped line numbers and the touched page scopes
+  venue_ids = {id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_({r['venues'] for _, r in records}), live(Venue))}
+  artist_ids = {id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_({r['artists'] for _, r in records}), live(Artist))}
+  kept = []
+  dropped = []
+  for line_num, record in records:
+    if record['venues'] in venue_ids and record['artists'] in artist_ids:
+      kept.append(record)
+    else:
+      dropped.append(line_num)
+  return dropped, insert_shows(kept)
+
+def import_rows(kind, rows, batch_size=1000):
+  # validates and writes (line number, row) pairs one committed batch at a time
+  report = ImportReport(kind)
+  for batch in batched(rows, batch_size):
+    records = []
+    for line_num, row in batch:
+      report.rows += 1
+      if not isinstance(row, dict):
+        report.error(line_num, {'row': [str(row) or 'Expected an object.']})
+        continue
+      try:
+        record = validate_show_row(row) if kind == 'shows' else validate_entity_row(kind, row)
+      except ValueError as e:
+        report.error(line_num, e.args[0])
+        continue
+      records.append((line_num, record))
+    if not records:
+      continue
+
+    try:
+      if kind == 'shows':
+        dropped, scopes = write_show_batch(records)
+        for line_num in dropped:
+          report.error(line_num, {'venue_id': ['Unknown venue or artist.']})
+        imported = []
+      else:
+        dropped = []
+        scopes = [kind]
+        imported = write_entity_batch(kind, [record for _, record in records])
+      db.session.commit()
+      page_cache.invalidate(*scopes)
+    except Exception as e:
+      db.session.rollback()
+      app.logger.exception('bulk import batch failed')
+      for line_num, _ in records:
+        report.error(line_num, {'batch': ['%s: %s' % (e.__class__.__name__, e)]})
+      continue
+
+    report.imported += len(records) - len(dropped)
+    for entity_id, name in imported:
+      search_index_put(IMPORT_KINDS[kind][1], entity_id, name)
+  return report
+
+def import_format(filename, fmt=None):
+  if fmt:
+    return fmt
+  return 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_command(kind, source, fmt, batch_size):
+  # e.g. flask import shows shows.ndjson
+  report = import_rows(kind, read_rows(source, import_format(source.name, fmt)), batch_size).as_dict()
+  for error in report['errors']:
+    click.echo('line %(line)s: %(errors)s' % error, err=True)
+  click.echo('%(imported)d of %(rows)d %(kind)s imported, %(failed)d failed in %(seconds)ss (%(rows_per_second)d rows/s)' % report)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -108,74 +976,41 @@ def index():
   return render_template('pages/home.html')
 
 
+@app.route('/search', methods=['POST'])
+def search():
+  # one search box for venues, artists and "City, State" areas
+  response = search_everything(request.form['search_term'], app.config['SEARCH_RESULTS_PER_PAGE'])
+  return render_template('pages/search.html', results=response, search_term=request.form.get('search_term', ''))
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached_page('venues')
 def venues():
-  data=[]
-  cities = Venue.query.with_entities(Venue.city, Venue.state).distinct().all()
-  for city in cities:
-    venues_by_city = Venue.query.filter_by(city=city[0]).all()
-    jsons=[]
-    for v in venues_by_city:
-      #num_shows should be aggregated based on number of upcoming shows per venue.
-      upcoming_shows_query = Show.query.filter(Show.venues==v.id, Show.start_time > datetime.now())
-      upcoming_shows_count = upcoming_shows_query.count()
-
-      jsons.append({'id': v.id,'name': v.name, 'num_upcoming_shows':upcoming_shows_count})
-    data.append({'city':city[0], 'state':city[1], 'venues': jsons})
-
-  return render_template('pages/venues.html', areas=data);
+  return stream_template('pages/venues.html', areas=venue_directory())
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  search = request.form['search_term']
-  search = '%'+search+'%'
-  venues_query = Venue.query.filter(Venue.name.ilike(search))
-  venues = venues_query.all()
-  venues_count = venues_query.count()
-
-  data=[]
-  for venue in venues:
-    upcoming_shows_query = Show.query.filter(Show.venues==venue.id, Show.start_time > datetime.now())
-    upcoming_shows_count = upcoming_shows_query.count()
-    data.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": upcoming_shows_count,
-    })
-  response = {"count": venues_count, "data":data}
+  page = max(request.form.get('page', 1, type=int), 1)
+  venues_count, data = search_by_name(Venue, request.form['search_term'], page, app.config['SEARCH_RESULTS_PER_PAGE'])
+  response = {"count": venues_count, "data":data, "page": page, "has_next": page * app.config['SEARCH_RESULTS_PER_PAGE'] < venues_count}
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  venue = Venue.query.filter_by(id=venue_id).first()
-  shows = Show.query.filter(Show.venues==venue.id).all()
+  read_detail = detail_concurrently if app.config['CONCURRENT_DETAIL_READS'] else detail_with_timeline
+  venue, past_shows, upcoming_shows = read_detail(Venue, venue_id)
+  if venue is None:
+    abort(404)
+  genres = Genre.names(venue.genre_mask)
 
-  past_shows = []
-  upcoming_shows = []
-  for s in shows:
-    artist = Artist.query.filter_by(id=s.artists).first()
-    json = { 
-      "artist_id": artist.id,
-      "artist_name": artist.name,
-      "artist_image_link":artist.image_link,
-      "start_time": str(s.start_time)
-    }
-    if (s.start_time<datetime.now()):
-      past_shows.append(json)        
-    else:
-      upcoming_shows.append(json)
-
-  genres =[]
-  for g in venue.venue_genres:
-    genres.append(g.genre)
-
-  data=[{
+  data={
     "id": venue_id,
     "name": venue.name,
     "genres": genres,
@@ -192,10 +1027,23 @@ def show_venue(venue_id):
     "upcoming_shows": upcoming_shows,
     "past_shows_count": len(past_shows),
     "upcoming_shows_count": len(upcoming_shows),
-  }]
-  data = list(filter(lambda d: d['id'] == venue_id, data))[0]
+  }
   return render_template('pages/show_venue.html', venue=data)
 
+def genre_listing(model):
+  # e.g. /venues/genres?genre=Jazz&genre=Blues&match=all
+  genres = [Genre.lookup(label) for label in request.args.getlist('genre')]
+  match = request.args.get('match', 'any')
+  if not genres or None in genres or match not in ('any', 'all'):
+    abort(400)
+  limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+  data, next_cursor = find_by_genres(model, genres, match, limit, request.args.get('after', type=int))
+  return jsonify({"count": len(data), "data": data, "next": next_cursor})
+
+@app.route('/venues/genres')
+def venues_by_genre():
+  return genre_listing(Venue)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -223,19 +1071,17 @@ def create_venue_submission():
     seeking_description= request.form['seeking_description']
     new_venue = Venue(name=name, city=city, state=state, phone=phone, address=address, website=website, image_link=image_link, facebook_link=facebook_link, seeking_talent=seeking_talent, seeking_description=seeking_description)
 
-    genres = ['Classical', 'Country']
-    for g in genres:
-      new_venue_genre = VenueGenre(genre=g, venue_id=new_venue.id)
-      db.session.add(new_venue_genre)
+    set_genres(new_venue, form_genres())
 
     db.session.add(new_venue)
+    bump_area((city, state), venues=1)
     db.session.commit()
+    search_index_put(Venue, new_venue.id, name)
+    page_cache.invalidate('venues')
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
-  finally:
-    db.session.close()
 
   if error:
     flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
@@ -249,21 +1095,24 @@ def delete_venue(venue_id):
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
+    # soft delete; purge_deleted() removes the venue and its shows later, in batches
     try:
-      Venue.query.filter_by(id=venue_id).delete()
+      scopes = soft_delete(Venue, int(venue_id))
       db.session.commit()
+      if scopes:
+        search_index_drop(Venue, int(venue_id))
+        page_cache.invalidate(*scopes)
     except:
       db.session.rollback()
-    finally:
-      db.session.close()
 
     return {'response':'success', 'redirecturl': url_for('index')}
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached_page('artists')
 def artists():
-  results = Artist.query.all()
+  results = Artist.query.filter(live(Artist)).all()
   data=[]
   for artist in results:
     data.append({'id':artist.id, 'name':artist.name})
@@ -273,81 +1122,55 @@ def artists():
 def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  search = request.form['search_term']
-  search = '%'+search+'%'
-  artists_query= Artist.query.filter(Artist.name.ilike(search))
-  artists= artists_query.all()
-  artists_count= artists_query.count()
-
-  data=[]
-  for artist in artists:
-    upcoming_shows_query = Show.query.filter(Show.artists==artist.id, Show.start_time > datetime.now())
-    upcoming_shows_count = upcoming_shows_query.count()
-    data.append({
-        "id": artist.id,
-        "name": artist.name,
-        "num_upcoming_shows": upcoming_shows_count,
-    })
-  response = {"count": artists_count, "data":data}
+  page = max(request.form.get('page', 1, type=int), 1)
+  artists_count, data = search_by_name(Artist, request.form['search_term'], page, app.config['SEARCH_RESULTS_PER_PAGE'])
+  response = {"count": artists_count, "data":data, "page": page, "has_next": page * app.config['SEARCH_RESULTS_PER_PAGE'] < artists_count}
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
-  data=[]
-  artists = Artist.query.filter_by(id=artist_id).all()
-  shows = Show.query.filter_by(artists=artist_id).all()
+  read_detail = detail_concurrently if app.config['CONCURRENT_DETAIL_READS'] else detail_with_timeline
+  artist, past_shows, upcoming_shows = read_detail(Artist, artist_id)
+  if artist is None:
+    abort(404)
+  genres = Genre.names(artist.genre_mask)
 
-  past_shows = []
-  upcoming_shows = []
-  for s in shows:
-    venue = Venue.query.filter_by(id=s.venues).first()
-    json = { 
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "venue_image_link": venue.image_link,
-      "start_time": str(s.start_time)
-    }
-    if (s.start_time<datetime.now()):
-      past_shows.append(json)        
-    else:
-      upcoming_shows.append(json)
-
-  for artist in artists:
-      genres = []
-      for g in artist.artist_genres:
-        genres.append(g.genre)
-
-      data.append({
-        "id": artist_id,
-        "name": artist.name,
-        "genres": genres,
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "website": artist.website,
-        "facebook_link": artist.facebook_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "image_link": artist.image_link,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
-      })
-  data = list(filter(lambda d: d['id'] == artist_id, data))[0]
+  data={
+    "id": artist_id,
+    "name": artist.name,
+    "genres": genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/genres')
+def artists_by_genre():
+  return genre_listing(Artist)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
 
-  artist= Artist.query.filter_by(id=artist_id).first()
+  artist= Artist.query.filter(Artist.id == artist_id, live(Artist)).first_or_404()
+  form.genres.data = Genre.names(artist.genre_mask)
   data={
     "id": artist_id,
     "name": artist.name,
-    "genres": artist.artist_genres,
+    "genres": form.genres.data,
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -365,7 +1188,7 @@ def edit_artist_submission(artist_id):
   error = False
 
   try:
-    artist = Artist.query.filter_by(id=artist_id).first()
+    artist = Artist.query.filter(Artist.id == artist_id, live(Artist)).one()
 
     artist.name = request.form['name']
     artist.city = request.form['city']
@@ -377,14 +1200,15 @@ def edit_artist_submission(artist_id):
     artist.website = request.form['website']
     artist.seeking_description= request.form['seeking_description']
     artist.seeking_venue = "seeking_venue" in request.form
+    set_genres(artist, form_genres())
     
     db.session.commit()
+    search_index_put(Artist, artist_id, request.form['name'])
+    page_cache.invalidate('artists', 'shows', 'artist:%s' % artist_id, *counterpart_scopes(Show.artists, artist_id))
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
-  finally:
-    db.session.close()
 
   if error:
     flash('An error occurred. Changes to artist ' + request.form['name'] + ' could not be saved.')
@@ -396,24 +1220,25 @@ def edit_artist_submission(artist_id):
 @app.route('/artists/<artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
     try:
-      Artist.query.filter_by(id=artist_id).delete()
+      scopes = soft_delete(Artist, int(artist_id))
       db.session.commit()
+      if scopes:
+        search_index_drop(Artist, int(artist_id))
+        page_cache.invalidate(*scopes)
     except:
       db.session.rollback()
-    finally:
-      db.session.close()
 
     return {'response':'success', 'redirecturl': url_for('index')}
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue= Venue.query.filter_by(id=venue_id).first()
-  genres= Venue.venue_genres
+  venue= Venue.query.filter(Venue.id == venue_id, live(Venue)).first_or_404()
+  form.genres.data = Genre.names(venue.genre_mask)
   venue={
     "id": venue_id,
     "name": venue.name,
-    "genres": venue.venue_genres,
+    "genres": form.genres.data,
     "address": venue.address,
     "city": venue.city,
     "state": venue.state,
@@ -432,7 +1257,8 @@ def edit_venue_submission(venue_id):
   error = False
 
   try:
-    venue = Venue.query.filter_by(id=venue_id).first()
+    venue = Venue.query.filter(Venue.id == venue_id, live(Venue)).with_for_update().one()
+    old_area = (venue.city, venue.state)
 
     venue.name = request.form['name']
     venue.city = request.form['city']
@@ -440,20 +1266,23 @@ def edit_venue_submission(venue_id):
     venue.city= request.form['city']
     venue.address = request.form['address']
     venue.phone = request.form['phone']
-    venue.genres = request.form['genres']
+    set_genres(venue, form_genres())
     venue.image_link = request.form['image_link']
     venue.facebook_link = request.form['facebook_link']
     venue.website = request.form['website']
     venue.seeking_description= request.form['seeking_description']
     venue.seeking_talent= "seeking_talent" in request.form
+    if (venue.city, venue.state) != old_area:
+      bump_area(old_area, venues=-1, upcoming=-venue.upcoming_shows_count)
+      bump_area((venue.city, venue.state), venues=1, upcoming=venue.upcoming_shows_count)
     
     db.session.commit()
+    search_index_put(Venue, venue_id, request.form['name'])
+    page_cache.invalidate('venues', 'shows', 'venue:%s' % venue_id, *counterpart_scopes(Show.venues, venue_id))
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
-  finally:
-    db.session.close()
 
   if error:
     flash('An error occurred. Changes to venue ' + request.form['name'] + ' could not be saved.')
@@ -487,15 +1316,16 @@ def create_artist_submission():
     seeking_venue = "seeking_venue" in request.form
     website = request.form['website']
     new_artist = Artist(name=name, city=city, state=state, phone=phone, image_link=image_link, facebook_link=facebook_link, seeking_description=seeking_description, seeking_venue=seeking_venue, website=website)
+    set_genres(new_artist, form_genres())
     db.session.add(new_artist)
     db.session.commit()
+    search_index_put(Artist, new_artist.id, name)
+    page_cache.invalidate('artists')
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
     data = []
-  finally:
-    db.session.close()
 
   data = new_artist
 
@@ -511,22 +1341,19 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached_page('shows')
 def shows():
-  # displays list of shows at /shows
-  shows = Show.query.all()
-  data=[]
-  for show in shows:
-    venue = Venue.query.filter_by(id=show.venues).first()
-    artist = Artist.query.filter_by(id=show.artists).first()
-    data.append({
-      "venue_id": show.venues,
-      "venue_name": venue.name,
-      "artist_id": show.artists,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time.strftime("%H:%M:%S")
-    })
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one page at a time
+  # e.g. /shows?from=2020-05-01&to=2020-06-01&venue_id=1&after=<next_cursor>
+  filters = {k: request.args[k] for k in ('from', 'to', 'venue_id', 'artist_id') if request.args.get(k)}
+  limit = min(max(request.args.get('limit', app.config['SHOWS_PER_PAGE'], type=int), 1), app.config['SHOWS_MAX_PER_PAGE'])
+  try:
+    data, next_cursor = show_listing(limit, **show_filters(request.args))
+  except ValueError:
+    abort(400)
+
+  next_url = url_for('shows', after=next_cursor, limit=limit, **filters) if next_cursor else None
+  return render_template('pages/shows.html', shows=data, next_url=next_url)
 
 @app.route('/shows/create')
 def create_shows():
@@ -541,29 +1368,247 @@ def create_show_submission():
   # on successful db insert, flash success
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   error = False
+  conflict = False
 
   try:
-    venues= request.form['venue_id']
-    artists = request.form['artist_id']
-    artist_name = Artist.query.filter_by(id=artists).first().name
-    start_time = request.form['start_time']
-    new_show = Show(venues=venues,artists=artists, start_time=start_time) 
-    db.session.add(new_show)
+    show = {
+      'venues': int(request.form['venue_id']),
+      'artists': int(request.form['artist_id']),
+      'start_time': dateutil.parser.parse(request.form['start_time']),
+    }
+    scopes, artists = schedule_shows([show])
+    artist_name = artists[show['artists']]
     db.session.commit()
+    page_cache.invalidate(*scopes)
+  except ScheduleConflict:
+    conflict = True
+    db.session.rollback()
   except:
     error = True
     db.session.rollback()
     print(sys.exc_info())
-  finally:
-    db.session.close()
 
-  if error:
+  if conflict:
+    flash('Show for ' + request.form['artist_id'] + ' could not be listed. The venue or artist is already booked at that time.')
+  elif error:
     flash('An error occurred. Show for ' + request.form['artist_id'] + ' could not be listed.')
   else:
     flash('Show for ' + artist_name + ' was successfully listed!')
 
   return render_template('pages/home.html')
 
+@app.route('/shows/batch', methods=['POST'])
+def create_show_batch():
+  # {"shows": [{"venue_id": 1, "artist_id": 4, "start_time": "2021-05-21 21:30:00"}, ...]}
+  # all shows are listed in one transaction, or none if any would double-book a venue or artist
+  content = request.get_json(silent=True)
+  entries = content.get('shows') if isinstance(content, dict) else None
+  if not isinstance(entries, list) or not entries:
+    return api_error(400, 'Expected {"shows": [...]}')
+
+  shows = []
+  errors = []
+  for n, entry in enumerate(entries):
+    try:
+      shows.append(validate_show_row(entry if isinstance(entry, dict) else {}))
+    except ValueError as e:
+      errors.append({"show": n, "errors": e.args[0]})
+  if errors:
+    return jsonify({"success": False, "error": 400, "message": "Invalid shows.", "errors": errors}), 400
+
+  try:
+    scopes, artists = schedule_shows(shows)
+    db.session.commit()
+  except ScheduleConflict as e:
+    db.session.rollback()
+    return jsonify({"success": False, "error": 409, "message": "Shows would double-book a venue or artist.", "conflicts": e.conflicts}), 409
+  except ValueError as e:
+    db.session.rollback()
+    return jsonify({"success": False, "error": 400, "message": "Unknown venues or artists.", "errors": e.args[0]}), 400
+  except:
+    db.session.rollback()
+    app.logger.exception('show batch failed')
+    return api_error(422, "We're sorry. The request was understood but unable to be processed.")
+
+  page_cache.invalidate(*scopes)
+  return jsonify({"success": True, "created": len(shows)})
+
+#  JSON API
+#  ----------------------------------------------------------------
+# Row-tuple queries only (no ORM objects); listings stream and accept ?fields=a,b
+
+API_FIELDS = {
+  'venues': (Venue, {
+    'id': Venue.id, 'name': Venue.name, 'city': Venue.city, 'state': Venue.state,
+    'address': Venue.address, 'phone': Venue.phone, 'website': Venue.website,
+    'image_link': Venue.image_link, 'facebook_link': Venue.facebook_link,
+    'seeking_talent': Venue.seeking_talent, 'seeking_description': Venue.seeking_description,
+    'genres': Venue.genre_mask, 'num_upcoming_shows': Venue.upcoming_shows_count, 'num_past_shows': Venue.past_shows_count,
+  }),
+  'artists': (Artist, {
+    'id': Artist.id, 'name': Artist.name, 'city': Artist.city, 'state': Artist.state,
+    'phone': Artist.phone, 'website': Artist.website,
+    'image_link': Artist.image_link, 'facebook_link': Artist.facebook_link,
+    'seeking_venue': Artist.seeking_venue, 'seeking_description': Artist.seeking_description,
+    'genres': Artist.genre_mask, 'num_upcoming_shows': Artist.upcoming_shows_count, 'num_past_shows': Artist.past_shows_count,
+  }),
+}
+SHOW_FIELDS = ('venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+def api_error(status, message):
+  return jsonify({"success": False, "error": status, "message": message}), status
+
+def api_fields(available, extra=()):
+  fields = [f for f in request.args.get('fields', '').split(',') if f]
+  unknown = [f for f in fields if f not in available and f not in extra]
+  if unknown:
+    raise ValueError('Unknown fields: %s' % ', '.join(unknown))
+  return fields or list(available) + list(extra)
+
+def api_value(field, value):
+  return Genre.names(value) if field == 'genres' else value
+
+def api_limit():
+  # no limit streams the whole listing
+  limit = request.args.get('limit', type=int)
+  return max(limit, 1) if limit is not None else None
+
+def api_stream(rows, limit, to_item, cursor):
+  # streams up to limit rows; 'next' is the cursor of the last row when more remain
+  state = {'last': None, 'more': False}
+
+  def items():
+    for n, row in enumerate(rows):
+      if limit is not None and n == limit:
+        state['more'] = True
+        break
+      state['last'] = row
+      yield to_item(row)
+
+  def tail():
+    return {"next": cursor(state['last']) if state['more'] else None}
+
+  return Response(stream_with_context(stream_listing(items(), tail)), mimetype='application/json')
+
+@app.route('/api/v1/<any(venues, artists):kind>')
+def api_listing(kind):
+  model, columns = API_FIELDS[kind]
+  try:
+    fields = api_fields(columns)
+  except ValueError as e:
+    return api_error(400, str(e))
+  limit = api_limit()
+
+  query = db.session.query(model.id, *[columns[f] for f in fields]).filter(live(model)).order_by(model.id)
+  if request.args.get('after', type=int) is not None:
+    query = query.filter(model.id > request.args.get('after', type=int))
+  if limit is not None:
+    query = query.limit(limit + 1)
+
+  return api_stream(query.yield_per(1000), limit,
+    lambda row: {f: api_value(f, v) for f, v in zip(fields, row[1:])},
+    lambda row: row[0])
+
+@app.route('/api/v1/<any(venues, artists):kind>/<int:entity_id>')
+def api_detail(kind, entity_id):
+  model, columns = API_FIELDS[kind]
+  try:
+    fields = api_fields(columns, extra=('past_shows', 'upcoming_shows'))
+  except ValueError as e:
+    return api_error(400, str(e))
+
+  plain = [f for f in fields if f in columns]
+  row = db.session.query(model.id, *[columns[f] for f in plain]).filter(model.id == entity_id, live(model)).first()
+  if row is None:
+    return api_error(404, "We're sorry. Resource was not found.")
+  data = {f: api_value(f, v) for f, v in zip(plain, row[1:])}
+
+  if 'past_shows' in fields or 'upcoming_shows' in fields:
+    if kind == 'venues':
+      past_shows, upcoming_shows = show_timeline(Show.venues, entity_id, Artist, "artist")
+    else:
+      past_shows, upcoming_shows = show_timeline(Show.artists, entity_id, Venue, "venue")
+    for f, shows in (('past_shows', past_shows), ('upcoming_shows', upcoming_shows)):
+      if f in fields:
+        data[f] = shows
+  # the listings' encoder, so start_time is ISO 8601 here too rather than jsonify's HTTP date
+  return Response(json_encoder.encode({"success": True, "data": data}), mimetype='application/json')
+
+@app.route('/api/v1/shows')
+def api_shows():
+  try:
+    fields = api_fields(SHOW_FIELDS)
+    query = show_query(**show_filters(request.args))
+  except ValueError as e:
+    return api_error(400, str(e))
+  limit = api_limit()
+  if limit is not None:
+    query = query.limit(limit + 1)
+
+  # rows are (id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link)
+  positions = {'start_time': 1, 'venue_id': 2, 'venue_name': 3, 'artist_id': 4, 'artist_name': 5, 'artist_image_link': 6}
+  return api_stream(query.yield_per(1000), limit,
+    lambda row: {f: row[positions[f]] for f in fields},
+    lambda row: encode_show_cursor(row[1], row[0]))
+
+@app.route('/api/v1/areas')
+def api_areas():
+  # areas with the most upcoming shows, optionally within one state: /api/v1/areas?state=CA&limit=10
+  limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+  query = db.session.query(Area.city, Area.state, Area.num_venues, Area.num_upcoming_shows).filter(Area.num_venues > 0)
+  if request.args.get('state'):
+    query = query.filter(Area.state == request.args['state'])
+  rows = query.order_by(Area.num_upcoming_shows.desc(), Area.num_venues.desc()).limit(limit)
+  return jsonify({"success": True, "data": [{
+    "city": city,
+    "state": state,
+    "num_venues": num_venues,
+    "num_upcoming_shows": num_upcoming_shows,
+  } for city, state, num_venues, num_upcoming_shows in rows]})
+
+@app.route('/api/v1/search')
+def api_search():
+  term = request.args.get('q', '')
+  if not term:
+    return api_error(400, 'Missing search term ?q=')
+  try:
+    fields = api_fields(('type', 'id', 'name', 'city', 'state', 'num_venues', 'num_upcoming_shows', 'score'))
+  except ValueError as e:
+    return api_error(400, str(e))
+  limit = min(max(request.args.get('limit', app.config['SEARCH_RESULTS_PER_PAGE'], type=int), 1), 100)
+  results = search_everything(term, limit)
+  results['data'] = [{f: hit[f] for f in fields if f in hit} for hit in results['data']]
+  return jsonify(dict(results, success=True))
+
+#  Bulk import
+#  ----------------------------------------------------------------
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_submission(kind):
+  # streams a csv or ndjson request body into the catalog, e.g.
+  # curl -H 'Content-Type: application/x-ndjson' --data-binary @venues.ndjson /import/venues
+  if kind not in ('venues', 'artists', 'shows'):
+    abort(404)
+  fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+  if fmt not in FORMATS:
+    abort(400)
+  batch_size = min(max(request.args.get('batch_size', 1000, type=int), 1), 10000)
+  report = import_rows(kind, read_rows(text_stream(request.stream), fmt), batch_size)
+  return jsonify(report.as_dict())
+
+#  Operations
+#  ----------------------------------------------------------------
+
+@app.route('/__pool')
+def pool_metrics():
+  # checked-out connections and checkout waits per engine, for sizing DB_POOL_SIZE against the worker count
+  if not app.config['POOL_METRICS']:
+    abort(404)
+  engines = {'primary': db.get_engine(app)}
+  if 'replica' in (app.config['SQLALCHEMY_BINDS'] or {}):
+    engines['replica'] = db.get_engine(app, bind='replica')
+  return jsonify({name: pool_status(engine.pool) for name, engine in engines.items()})
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -589,6 +1634,10 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
+    if app.config.get('SHOW_ROLLOVER_INTERVAL'):
+        start_periodic('show-rollover', rollover_shows, app.config['SHOW_ROLLOVER_INTERVAL'])
+    if app.config.get('PURGE_INTERVAL'):
+        start_periodic('purge-deleted', purge_deleted, app.config['PURGE_INTERVAL'])
     app.run()
 
 # Or specify port manually:
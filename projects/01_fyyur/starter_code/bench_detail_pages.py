@@ -0,0 +1,136 @@
+'''
+Detail page read path under concurrent load.
+
+  python bench_detail_pages.py [--threads 16] [--requests 2000] [--shows 200]
+
+Seeds a scratch database (a temporary SQLite file, or BENCH_DATABASE_URL, which
+is dropped and recreated) and runs <requests> reads from <threads> concurrent
+clients for each of:
+
+  two_queries      detail_with_timeline(): the venue row, then only its show columns (what show_venue does)
+  concurrent       detail_concurrently(): the same two reads side by side, the timeline on a search_pool thread
+  one_query        the venue outer-joined to its shows in one statement
+  page             GET /venues/<id> through the test client, each url a page cache miss
+  page_concurrent  the same with CONCURRENT_DETAIL_READS on
+
+one_query saves a round trip but repeats the whole venue row on every show row;
+on SQLite and on a local postgres that costs more than the round trip it saves,
+which is why show_venue keeps the two lean reads. concurrent hides a round trip
+instead, for a second connection per request and a hop through the SEARCH_WORKERS
+threads, which every client shares; SQLite serializes the reads anyway. Run both
+against a networked postgres (BENCH_DATABASE_URL) before turning either on.
+'''
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import app, db, detail_with_timeline, detail_concurrently, split_timeline, live, Venue, Artist, Show
+
+
+def seed(venues, shows):
+    db.drop_all()
+    db.create_all()
+    artists = [Artist(name='Artist %d' % i, city='San Francisco', state='CA') for i in range(20)]
+    places = [Venue(name='Venue %d' % i, city='San Francisco', state='CA') for i in range(venues)]
+    db.session.add_all(artists + places)
+    db.session.flush()
+    now = datetime.now()
+    db.session.execute(Show.__table__.insert(), [{
+        'venues': places[i % venues].id,
+        'artists': artists[i % len(artists)].id,
+        'start_time': now + timedelta(days=i - shows // 2),
+        'is_past': i < shows // 2,
+    } for i in range(shows * venues)])
+    db.session.commit()
+    return [v.id for v in places]
+
+
+def two_queries(venue_id):
+    return detail_with_timeline(Venue, venue_id)
+
+
+def concurrent(venue_id):
+    return detail_concurrently(Venue, venue_id)
+
+
+def one_query(venue_id):
+    is_past = Show.start_time < datetime.now()
+    rows = db.session.query(Venue, Show.start_time, Artist.id, Artist.name, Artist.image_link, is_past)\
+        .outerjoin(Show, Show.venues == Venue.id)\
+        .outerjoin(Artist, db.and_(Show.artists == Artist.id, live(Artist)))\
+        .filter(Venue.id == venue_id, live(Venue))\
+        .order_by(Show.start_time, Show.id)\
+        .all()
+    if not rows:
+        return None, [], []
+    past_shows, upcoming_shows = split_timeline((r[1:] for r in rows if r[2] is not None), 'artist')
+    return rows[0][0], past_shows, upcoming_shows
+
+
+def run(read, ids, threads, requests):
+    # each client thread gets its own app context and so its own session and connection
+    def timed(n):
+        with app.app_context():
+            started = time.perf_counter()
+            read(ids[n % len(ids)], n)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'req/s': requests / elapsed,
+        'p50 ms': latencies[len(latencies) // 2] * 1000,
+        'p95 ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'max ms': latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the venue detail read path.')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--venues', type=int, default=10)
+    parser.add_argument('--shows', type=int, default=200, help='shows per venue')
+    args = parser.parse_args()
+
+    db_file = None
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        fd, db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = 'sqlite:///' + db_file
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    # the pool must not be the bottleneck being measured; concurrent holds two connections per client
+    app.config['DB_POOL_SIZE'] = args.threads * 2
+    client = app.test_client()
+
+    try:
+        with app.app_context():
+            ids = seed(args.venues, args.shows)
+
+        page = lambda venue_id, n: client.get('/venues/%d?bench=%d' % (venue_id, n))
+        variants = [
+            ('two_queries', lambda venue_id, n: two_queries(venue_id), False),
+            ('concurrent', lambda venue_id, n: concurrent(venue_id), False),
+            ('one_query', lambda venue_id, n: one_query(venue_id), False),
+            ('page', page, False),
+            # urls past the ones page used, so these miss the cache too
+            ('page_concurrent', lambda venue_id, n: page(venue_id, args.requests + n), True),
+        ]
+        print('%d requests, %d threads, %d shows per venue, %s' % (args.requests, args.threads, args.shows, url.split(':')[0]))
+        for name, read, concurrent_pages in variants:
+            app.config['CONCURRENT_DETAIL_READS'] = concurrent_pages
+            result = run(read, ids, args.threads, args.requests)
+            print('%-16s ' % name + '  '.join('%s %8.2f' % item for item in result.items()))
+    finally:
+        if db_file:
+            os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# cache.py
+# Rendered-page cache keyed by the versions of the entities a page shows.
+# Writes bump versions instead of deleting pages, so stale entries simply stop being looked up.
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class MemoryBackend(object):
+  # in-process LRU; versions live outside the LRU so evicting pages can never roll a version back
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self._pages = OrderedDict()
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      value = self._pages.get(key)
+      if value is not None:
+        self._pages.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self._lock:
+      self._pages[key] = value
+      self._pages.move_to_end(key)
+      while len(self._pages) > self.maxsize:
+        self._pages.popitem(last=False)
+
+  def versions(self, names):
+    with self._lock:
+      return [self._versions.get(name, 0) for name in names]
+
+  def incr(self, name):
+    with self._lock:
+      self._versions[name] = self._versions.get(name, 0) + 1
+
+  def clear(self):
+    with self._lock:
+      self._pages.clear()
+      self._versions.clear()
+
+
+class RedisBackend(object):
+  # shares pages and versions between worker processes; pages expire after ttl seconds
+  def __init__(self, client, ttl=3600, prefix='fyyur:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def get(self, key):
+    return self.client.get(self.prefix + 'page:' + key)
+
+  def set(self, key, value):
+    self.client.set(self.prefix + 'page:' + key, value, ex=self.ttl)
+
+  def versions(self, names):
+    if not names:
+      return []
+    return [int(v or 0) for v in self.client.mget([self.prefix + 'v:' + name for name in names])]
+
+  def incr(self, name):
+    self.client.incr(self.prefix + 'v:' + name)
+
+  def clear(self):
+    for key in self.client.scan_iter(self.prefix + '*'):
+      self.client.delete(key)
+
+
+def backend_from_url(url, maxsize=1024):
+  # 'memory' or a redis:// url
+  if url.startswith(('redis://', 'rediss://', 'unix://')):
+    import redis
+    return RedisBackend(redis.Redis.from_url(url))
+  if url == 'memory':
+    return MemoryBackend(maxsize)
+  raise ValueError('Unknown page cache backend %r' % url)
+
+
+class PageCache(object):
+  def __init__(self, backend=None):
+    self.backend = backend or MemoryBackend()
+
+  def key(self, path, scopes, *variant):
+    # a page is identified by its url, the versions of everything it shows, and e.g. locale
+    versions = self.backend.versions(scopes)
+    parts = [path] + ['%s@%d' % sv for sv in zip(scopes, versions)] + [str(v) for v in variant]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+  def get(self, key):
+    # -> (etag, mimetype, body) or None
+    value = self.backend.get(key)
+    if value is None:
+      return None
+    etag, mimetype, body = value.split(b'\n', 2)
+    return etag.decode('ascii'), mimetype.decode('ascii'), body
+
+  def set(self, key, mimetype, body):
+    etag = hashlib.md5(body).hexdigest()
+    self.backend.set(key, etag.encode('ascii') + b'\n' + mimetype.encode('ascii') + b'\n' + body)
+    return etag
+
+  def invalidate(self, *scopes):
+    for scope in set(scopes):
+      self.backend.incr(scope)
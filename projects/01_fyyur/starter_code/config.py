@@ -1,7 +1,3 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-
 import os
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
@@ -11,8 +7,70 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///postgres'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///postgres')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+# A read replica for GET requests; unset, everything goes to the primary.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+# Seconds a client's reads stay on the primary after it writes, so it sees its
+# own change; keep it above the replica's usual lag.
+READ_PRIMARY_AFTER_WRITE = 5
+
+# Connection pool, per process and per database. Each gunicorn worker holds up
+# to DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep workers times that
+# under the server's max_connections. Request threads and the SEARCH_WORKERS
+# pool share it; watch checked_out and wait_ms at /__pool when tuning.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+# Seconds to wait for a free connection, and to keep one before reconnecting.
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Test connections on checkout so a restarted database doesn't fail requests.
+DB_POOL_PRE_PING = True
+# Milliseconds before postgres cancels a statement (0: no limit).
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 15000))
+# Pool status at /__pool.
+POOL_METRICS = DEBUG
+
+
+# Seconds between runs of the background job that moves started shows
+# from the upcoming to the past counters. Use `flask rollover-shows` from
+# cron instead when running under a multi-process server.
+SHOW_ROLLOVER_INTERVAL = 60
+
+# Page size of the /shows listing (?limit= may ask for up to the max).
+SHOWS_PER_PAGE = 30
+SHOWS_MAX_PER_PAGE = 100
+
+# Page size of the venue/artist search results.
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Threads shared by /search to query venues, artists and areas side by side,
+# and by the detail pages when CONCURRENT_DETAIL_READS is on.
+SEARCH_WORKERS = 6
+
+# Read a venue/artist page's row and its show timeline side by side on two
+# connections (see bench_detail_pages.py) instead of one after the other.
+CONCURRENT_DETAIL_READS = False
+
+# Date formatting: locale picked per request from Accept-Language, and the
+# zone shows are displayed in (None keeps the server's local time).
+DEFAULT_LOCALE = 'en_US'
+LANGUAGES = ['en_US', 'en_GB', 'de_DE', 'es_ES', 'fr_FR']
+DISPLAY_TIMEZONE = None
+
+# Rendered page cache: 'memory' (per process LRU of PAGE_CACHE_SIZE pages)
+# or a redis:// url to share pages and invalidations between workers.
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_SIZE = 1024
+
+# Per-request query counts, Server-Timing headers and the /__perf dashboard
+# (needs flask_query_profiler from /QueryProfiler installed).
+QUERY_PROFILER = DEBUG
+
+# How long a show occupies its venue and artist; shows of the same venue or
+# artist starting closer together than this are a double booking.
+SHOW_LENGTH_MINUTES = 180
 
+# Seconds between runs of the background job that hard-deletes soft-deleted
+# venues and artists with their shows (or run `flask purge-deleted` from cron).
+PURGE_INTERVAL = 300
@@ -0,0 +1,75 @@
+# dbpool.py
+# Connection pool options taken from config, and the numbers needed to tune them.
+import threading
+import time
+
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats(object):
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.checkouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+
+  def record(self, seconds):
+    with self._lock:
+      self.checkouts += 1
+      self.wait_total += seconds
+      self.wait_max = max(self.wait_max, seconds)
+
+  def as_dict(self):
+    with self._lock:
+      return {
+        'checkouts': self.checkouts,
+        'wait_ms_total': round(self.wait_total * 1000, 2),
+        'wait_ms_avg': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+        'wait_ms_max': round(self.wait_max * 1000, 2),
+      }
+
+
+class TimedQueuePool(QueuePool):
+  # QueuePool that records how long each checkout waited for a free connection
+  def __init__(self, *args, **kwargs):
+    QueuePool.__init__(self, *args, **kwargs)
+    self.stats = PoolStats()
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      return QueuePool._do_get(self)
+    finally:
+      self.stats.record(time.perf_counter() - started)
+
+
+def engine_options(config, url):
+  # pool and timeout options for postgres urls; other databases (SQLite in tests) keep the driver defaults
+  if not url.drivername.startswith('postgresql'):
+    return {}
+  options = {
+    'poolclass': TimedQueuePool,
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if config['DB_STATEMENT_TIMEOUT']:
+    options['connect_args'] = {'options': '-c statement_timeout=%d' % config['DB_STATEMENT_TIMEOUT']}
+  return options
+
+
+def pool_status(pool):
+  # what /__pool reports for one engine
+  status = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    status.update({
+      'size': pool.size(),
+      'checked_out': pool.checkedout(),
+      'checked_in': pool.checkedin(),
+      'overflow': max(pool.overflow(), 0),
+    })
+  if isinstance(pool, TimedQueuePool):
+    status.update(pool.stats.as_dict())
+  return status
@@ -1,4 +1,5 @@
 # enums.py
+import re
 from enum import Enum, auto
 
 class Genre(Enum):
@@ -24,4 +25,34 @@ class Genre(Enum):
   
   @classmethod
   def choices(cls):
-    return [ (choice.name, choice.name) for choice in cls ]
+    # built once; the forms share it
+    return _genre_choices
+
+  @property
+  def bit(self):
+    return 1 << (self.value - 1)
+
+  @classmethod
+  def mask(cls, genres):
+    # Genre members or their names -> int with one bit per genre
+    mask = 0
+    for genre in genres:
+      mask |= (genre if isinstance(genre, cls) else cls[genre]).bit
+    return mask
+
+  @classmethod
+  def names(cls, mask):
+    return [choice.name for choice in cls if mask & choice.bit]
+
+  @classmethod
+  def lookup(cls, label):
+    # 'hip hop', 'Hip-Hop' and 'Hip_Hop' all resolve to Genre.Hip_Hop; None if unknown
+    return _genre_keys.get(_genre_key(label))
+
+def _genre_key(label):
+  key = re.sub(r'\s*&\s*', '_and_', str(label).strip())
+  return re.sub(r'[\s\-_]+', '_', key).lower()
+
+_genre_keys = {_genre_key(g.name): g for g in Genre}
+
+_genre_choices = [(g.name, g.name) for g in Genre]
@@ -0,0 +1,73 @@
+# formatting.py
+# The |datetime template filter, with babel patterns compiled once and repeated values memoized.
+# Run `python formatting.py` for a micro-benchmark against the old parse-and-format filter.
+import functools
+from datetime import datetime
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+NAMED_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=256)
+def compiled_pattern(format, locale):
+  return babel.dates.parse_pattern(NAMED_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@functools.lru_cache(maxsize=64)
+def timezone(name):
+  # raises LookupError for unknown zone names
+  return babel.dates.get_timezone(name)
+
+
+@functools.lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale='en_US', tz=None):
+  # strings are still accepted for old callers, datetimes skip the parse
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  if tz:
+    # naive values are in the server's local time
+    value = value.astimezone(timezone(tz))
+  pattern, locale = compiled_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+
+def _legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(date, NAMED_FORMATS.get(format, format))
+
+
+def benchmark(rows=10000, distinct=500):
+  # a show listing: <rows> shows spread over <distinct> start times
+  import timeit
+  base = datetime(2020, 5, 21, 21, 30)
+  values = [base.replace(day=1 + i % 28, hour=i % 24) for i in range(distinct)]
+  shows = [values[i % distinct] for i in range(rows)]
+  strings = [str(v) for v in shows]
+
+  def legacy():
+    for s in strings:
+      _legacy_format_datetime(s, 'full')
+
+  def cold():
+    format_datetime.cache_clear()
+    for v in shows:
+      format_datetime(v, 'full')
+
+  def warm():
+    for v in shows:
+      format_datetime(v, 'full')
+
+  warm()
+  for name, fn in (('legacy', legacy), ('cached, cold', cold), ('cached, warm', warm)):
+    seconds = min(timeit.repeat(fn, number=1, repeat=3))
+    print('%-14s %8.1f ms for %d rows' % (name, seconds * 1000, rows))
+
+
+if __name__ == '__main__':
+  benchmark()
@@ -0,0 +1,80 @@
+# importer.py
+# Streaming readers and bookkeeping for the bulk import pipeline; the db writes live in app.py.
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+FORMATS = ('csv', 'ndjson')
+
+
+def read_rows(stream, fmt):
+  # yields (line number, row dict) from a text stream without reading it all in
+  if fmt == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  elif fmt == 'ndjson':
+    for line_num, line in enumerate(stream, 1):
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError as e:
+        row = e
+      yield line_num, row
+  else:
+    raise ValueError('Unknown import format %r, expected one of %s' % (fmt, ', '.join(FORMATS)))
+
+
+def text_stream(binary):
+  return io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+
+def batched(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    batch = list(islice(iterator, size))
+    if not batch:
+      return
+    yield batch
+
+
+def split_list(value):
+  # genres arrive as a JSON list (ndjson) or a comma/semicolon separated cell (csv)
+  if value is None:
+    return []
+  if isinstance(value, (list, tuple)):
+    return [str(v).strip() for v in value if str(v).strip()]
+  return [v.strip() for v in str(value).replace(';', ',').split(',') if v.strip()]
+
+
+class ImportReport(object):
+  def __init__(self, kind, max_errors=1000):
+    self.kind = kind
+    self.max_errors = max_errors
+    self.rows = 0
+    self.imported = 0
+    self.failed = 0
+    self.errors = []
+    self.started = time.time()
+
+  def error(self, line_num, errors):
+    self.failed += 1
+    # only the first max_errors are kept so a bad file can't exhaust memory
+    if len(self.errors) < self.max_errors:
+      self.errors.append({'line': line_num, 'errors': errors})
+
+  def as_dict(self):
+    seconds = time.time() - self.started
+    return {
+      'kind': self.kind,
+      'rows': self.rows,
+      'imported': self.imported,
+      'failed': self.failed,
+      'errors': self.errors,
+      'seconds': round(seconds, 3),
+      'rows_per_second': int(self.rows / seconds) if seconds else self.rows,
+    }
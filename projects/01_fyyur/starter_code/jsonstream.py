@@ -0,0 +1,34 @@
+# jsonstream.py
+# Encodes {"data": [...], ...} a chunk at a time so API listings never sit in memory whole.
+import json
+from datetime import date, datetime
+
+
+def _default(value):
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  raise TypeError('%r is not JSON serializable' % (value,))
+
+
+encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+
+def stream_listing(items, tail=dict, chunk_size=16384):
+  # items is any iterable of dicts; tail() is called once the items are exhausted,
+  # so it can report things only known at the end (e.g. the next page cursor)
+  buf = ['{"data":[']
+  size = 0
+  for n, item in enumerate(items):
+    piece = encoder.encode(item)
+    buf.append(piece if n == 0 else ',' + piece)
+    size += len(piece) + 1
+    if size >= chunk_size:
+      yield ''.join(buf)
+      buf = []
+      size = 0
+
+  buf.append(']')
+  for key, value in tail().items():
+    buf.append(',%s:%s' % (encoder.encode(key), encoder.encode(value)))
+  buf.append('}')
+  yield ''.join(buf)
@@ -0,0 +1,40 @@
+"""show counter cache
+
+Revision ID: 3f1c2a9d7e4b
+Revises: 92184fcc69da
+Create Date: 2026-10-18 09:12:31.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7e4b'
+down_revision = '92184fcc69da'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('is_past', sa.Boolean(), server_default=sa.false(), nullable=False))
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill the counters from the existing shows
+    op.execute('UPDATE "Show" SET is_past = start_time <= LOCALTIMESTAMP')
+    for table, fk in (('Venue', 'venues'), ('Artist', 'artists')):
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{fk} = "{table}".id AND NOT s.is_past), '
+            'past_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{fk} = "{table}".id AND s.is_past)'
+            .format(table=table, fk=fk)
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_column('Show', 'is_past')
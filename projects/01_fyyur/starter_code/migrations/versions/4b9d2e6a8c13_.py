@@ -0,0 +1,44 @@
+"""area rollup
+
+Revision ID: 4b9d2e6a8c13
+Revises: 8c3e5a7f1b24
+Create Date: 2026-10-18 16:21:05.493271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9d2e6a8c13'
+down_revision = '8c3e5a7f1b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('num_venues', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('state', 'city', name='uq_Area_state_city')
+    )
+    op.create_index('ix_Area_activity', 'Area', ['num_upcoming_shows', 'num_venues'])
+    op.create_index('ix_Area_state_activity', 'Area', ['state', 'num_upcoming_shows', 'num_venues'])
+    # from here on the venue and show writers keep it current
+    op.execute('''
+        INSERT INTO "Area" (city, state, num_venues, num_upcoming_shows)
+        SELECT city, state, count(id), coalesce(sum(upcoming_shows_count), 0)
+        FROM "Venue"
+        WHERE deleted_at IS NULL AND city IS NOT NULL AND state IS NOT NULL
+        GROUP BY city, state
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_Area_state_activity', table_name='Area')
+    op.drop_index('ix_Area_activity', table_name='Area')
+    op.drop_table('Area')
@@ -0,0 +1,47 @@
+"""genre bitmask
+
+Revision ID: 5e8b1d3c9f60
+Revises: a7d04e6b52c1
+Create Date: 2026-10-18 11:24:05.771630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b1d3c9f60'
+down_revision = 'a7d04e6b52c1'
+branch_labels = None
+depends_on = None
+
+# enums.Genre as of this revision; bit = 1 << (value - 1)
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip_Hop',
+          'Heavy_Metal', 'Instrumental', 'Jazz', 'Musical_Theatre', 'Pop', 'Punk', 'R_AND_B',
+          'Reggae', 'Rock_n_Roll', 'Soul', 'Other']
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('genre_mask', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('genre_mask', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill from the existing genre rows
+    bits = ', '.join("('%s', %d)" % (name, 1 << i) for i, name in enumerate(GENRES))
+    for table, genre_table, fk in (('Venue', 'VenueGenre', 'venue_id'), ('Artist', 'ArtistGenre', 'artist_id')):
+        op.execute(
+            'UPDATE "{table}" SET genre_mask = COALESCE(('
+            'SELECT bit_or(b.bit) FROM "{genre_table}" g JOIN (VALUES {bits}) AS b(name, bit) ON b.name = g.genre '
+            'WHERE g.{fk} = "{table}".id), 0)'
+            .format(table=table, genre_table=genre_table, fk=fk, bits=bits)
+        )
+
+    # lets the bitwise genre filters scan a narrow index instead of the table
+    op.create_index('ix_Venue_genre_mask', 'Venue', ['genre_mask', 'id'])
+    op.create_index('ix_Artist_genre_mask', 'Artist', ['genre_mask', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genre_mask', table_name='Artist')
+    op.drop_index('ix_Venue_genre_mask', table_name='Venue')
+    op.drop_column('Artist', 'genre_mask')
+    op.drop_column('Venue', 'genre_mask')
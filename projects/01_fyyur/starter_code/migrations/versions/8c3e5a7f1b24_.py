@@ -0,0 +1,31 @@
+"""soft delete for venues and artists
+
+Revision ID: 8c3e5a7f1b24
+Revises: d2b6f0a41e87
+Create Date: 2026-10-18 15:02:47.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3e5a7f1b24'
+down_revision = 'd2b6f0a41e87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # nullable without a default, so adding the columns doesn't rewrite the tables
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('Artist', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_Venue_deleted_at', 'Venue', ['deleted_at'], postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_Artist_deleted_at', 'Artist', ['deleted_at'], postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_Artist_deleted_at', table_name='Artist')
+    op.drop_index('ix_Venue_deleted_at', table_name='Venue')
+    op.drop_column('Artist', 'deleted_at')
+    op.drop_column('Venue', 'deleted_at')
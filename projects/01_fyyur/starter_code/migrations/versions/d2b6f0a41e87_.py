@@ -0,0 +1,38 @@
+"""indexes for hot query paths
+
+Revision ID: d2b6f0a41e87
+Revises: 5e8b1d3c9f60
+Create Date: 2026-10-18 13:40:12.260519
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b6f0a41e87'
+down_revision = '5e8b1d3c9f60'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Show_venues_start_time', 'Show', ['venues', 'start_time']),
+    ('ix_Show_artists_start_time', 'Show', ['artists', 'start_time']),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_Show_is_past_start_time', 'Show', ['is_past', 'start_time']),
+    ('ix_Venue_state_city', 'Venue', ['state', 'city', 'id']),
+    ('ix_VenueGenre_venue_id', 'VenueGenre', ['venue_id']),
+    ('ix_ArtistGenre_artist_id', 'ArtistGenre', ['artist_id']),
+]
+
+
+def upgrade():
+    # built concurrently so a large Show table stays writable meanwhile
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,32 @@
+# scheduling.py
+# Double-booking checks for show scheduling; the db side lives in app.schedule_shows().
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+class ScheduleConflict(Exception):
+  def __init__(self, conflicts):
+    Exception.__init__(self, '%d scheduling conflicts' % len(conflicts))
+    self.conflicts = conflicts
+
+
+class BookingIndex(object):
+  # sorted start times per key (e.g. ('venue', 3)); two shows clash when they start less than <length> apart
+  def __init__(self, length):
+    self.length = length
+    self._starts = defaultdict(list)
+    self._labels = defaultdict(list)
+
+  def add(self, key, start, label):
+    starts = self._starts[key]
+    i = bisect_right(starts, start)
+    starts.insert(i, start)
+    self._labels[key].insert(i, label)
+
+  def overlapping(self, key, start):
+    starts = self._starts.get(key)
+    if not starts:
+      return []
+    lo = bisect_right(starts, start - self.length)
+    hi = bisect_left(starts, start + self.length)
+    return self._labels[key][lo:hi]
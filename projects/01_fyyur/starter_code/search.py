@@ -0,0 +1,89 @@
+# search.py
+# In-memory stand-in for the pg_trgm name index, used when the app runs on SQLite (tests, local dev).
+import re
+import threading
+from collections import defaultdict
+
+_word_split = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def raw_trigrams(text):
+  # every 3-char window of the lowercased text; a substring's windows are a subset of the text's
+  text = text.lower()
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def word_trigrams(text):
+  # trigrams the way pg_trgm builds them: per word, padded with two leading and one trailing space
+  grams = set()
+  for word in _word_split.split(text.lower()):
+    if word:
+      padded = '  ' + word + ' '
+      grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return grams
+
+
+def similarity(a, b):
+  # same measure as pg_trgm's similarity(): shared trigrams over all trigrams
+  ta, tb = word_trigrams(a), word_trigrams(b)
+  if not ta or not tb:
+    return 0.0
+  return len(ta & tb) / float(len(ta | tb))
+
+
+class TrigramIndex(object):
+  def __init__(self):
+    self.loaded = False
+    self._names = {}
+    self._postings = defaultdict(set)
+    self._lock = threading.Lock()
+
+  def load(self, rows):
+    # rows of (id, name); replaces whatever was indexed before
+    with self._lock:
+      self._names.clear()
+      self._postings.clear()
+      for doc_id, name in rows:
+        self._add(doc_id, name)
+      self.loaded = True
+
+  def put(self, doc_id, name):
+    with self._lock:
+      self._remove(doc_id)
+      self._add(doc_id, name)
+
+  def drop(self, doc_id):
+    with self._lock:
+      self._remove(doc_id)
+
+  def search(self, term, limit, offset=0):
+    # case-insensitive substring match ranked by similarity; returns (total, [ids])
+    needle = term.lower()
+    with self._lock:
+      grams = raw_trigrams(needle)
+      if grams:
+        candidates = set.intersection(*(self._postings.get(g, set()) for g in grams))
+      else:
+        candidates = self._names.keys()
+      hits = [doc_id for doc_id in candidates if needle in self._names[doc_id].lower()]
+      names = {doc_id: self._names[doc_id] for doc_id in hits}
+
+    hits.sort(key=lambda doc_id: (-similarity(names[doc_id], term), doc_id))
+    return len(hits), hits[offset:offset + limit]
+
+  def _add(self, doc_id, name):
+    name = name or ''
+    self._names[doc_id] = name
+    for gram in raw_trigrams(name):
+      self._postings[gram].add(doc_id)
+
+  def _remove(self, doc_id):
+    name = self._names.pop(doc_id, None)
+    if name is None:
+      return
+    for gram in raw_trigrams(name):
+      posting = self._postings.get(gram)
+      if posting is not None:
+        posting.discard(doc_id)
+        if not posting:
+          del self._postings[gram]
@@ -0,0 +1,509 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import session
+from sqlalchemy import event
+
+from app import app, db, page_cache, search_indexes, search_by_name, rollover_shows, purge_deleted, soft_delete, refresh_areas, set_genres, Venue, VenueGenre, Artist, ArtistGenre, Show, Area
+from enums import Genre
+from search import TrigramIndex, similarity
+
+SQLITE_SCAN = re.compile(r'^SCAN (TABLE )?(\w+)')
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Every statement a controller runs must be answered from an index, not a table scan.
+
+    Runs on a throwaway SQLite file by default. Set TEST_DATABASE_URL to a scratch
+    Postgres database to check the real plans; the schema is then built by the
+    migrations in migrations/versions, so the migration pack is checked as well.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_file = None
+        url = os.environ.get('TEST_DATABASE_URL')
+        if not url:
+            fd, cls.db_file = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            url = 'sqlite:///' + cls.db_file
+        app.config['SQLALCHEMY_DATABASE_URI'] = url
+        app.config['TESTING'] = True
+
+        with app.app_context():
+            db.drop_all()
+            if db.engine.dialect.name == 'postgresql':
+                from flask_migrate import upgrade
+                db.session.execute('DROP TABLE IF EXISTS alembic_version')
+                db.session.commit()
+                upgrade(directory=os.path.join(os.path.dirname(__file__), 'migrations'))
+            else:
+                db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.db_file:
+            os.remove(cls.db_file)
+
+    def setUp(self):
+        """Seed a small catalog and start from cold caches."""
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        for model in (Show, VenueGenre, ArtistGenre, Venue, Artist, Area):
+            model.query.delete()
+        db.session.commit()
+
+        now = datetime.now()
+        self.venues = [
+            Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street'),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY', address='335 Delancey Street'),
+        ]
+        self.artists = [
+            Artist(name='Guns N Petals', city='San Francisco', state='CA'),
+            Artist(name='The Wild Sax Band', city='San Francisco', state='CA'),
+        ]
+        set_genres(self.venues[0], [Genre.Jazz, Genre.Folk])
+        set_genres(self.artists[0], [Genre.Rock_n_Roll])
+        db.session.add_all(self.venues + self.artists)
+        db.session.flush()
+        db.session.add_all([
+            Show(venues=self.venues[0].id, artists=self.artists[0].id, start_time=now - timedelta(days=30), is_past=True),
+            Show(venues=self.venues[0].id, artists=self.artists[1].id, start_time=now + timedelta(days=30)),
+            Show(venues=self.venues[1].id, artists=self.artists[1].id, start_time=now - timedelta(minutes=5)),
+        ])
+        db.session.commit()
+        self.venue_id = self.venues[0].id
+        self.artist_id = self.artists[0].id
+
+        page_cache.backend.clear()
+        for index in search_indexes.values():
+            index.loaded = False
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def statements(self, fn):
+        captured = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                captured.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertTrue(captured)
+        return captured
+
+    def table_scans(self, statement, parameters):
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            if db.engine.dialect.name == 'postgresql':
+                # with seq scans priced out, a Seq Scan in the plan means no index can serve it
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+                return set(self.seq_scans(cursor.fetchone()[0][0]['Plan']))
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            scans = set()
+            for row in cursor.fetchall():
+                match = SQLITE_SCAN.match(row[-1])
+                if match and 'USING' not in row[-1] and match.group(2) in db.metadata.tables:
+                    scans.add(match.group(2))
+            return scans
+        finally:
+            raw.rollback()
+            raw.close()
+
+    def seq_scans(self, plan):
+        if plan['Node Type'] == 'Seq Scan':
+            yield plan['Relation Name']
+        for child in plan.get('Plans', []):
+            for relation in self.seq_scans(child):
+                yield relation
+
+    def assertIndexed(self, fn, allowed=()):
+        for statement, parameters in self.statements(fn):
+            scans = self.table_scans(statement, parameters) - set(allowed)
+            self.assertFalse(scans, 'table scan on %s in:\n%s' % (', '.join(sorted(scans)), statement))
+
+    def on_sqlite(self, *tables):
+        return tables if db.engine.dialect.name == 'sqlite' else ()
+
+    def get(self, url):
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+
+    def test_venues_directory(self):
+        """Test /venues reads the (state, city) index in order"""
+        self.assertIndexed(lambda: self.get('/venues'))
+
+    def test_venue_page(self):
+        """Test venue page and its show timeline"""
+        self.assertIndexed(lambda: self.get('/venues/%d' % self.venue_id))
+
+    def test_artist_page(self):
+        """Test artist page and its show timeline"""
+        self.assertIndexed(lambda: self.get('/artists/%d' % self.artist_id))
+
+    def test_shows_listing(self):
+        """Test /shows pages and filters"""
+        self.assertIndexed(lambda: self.get('/shows?limit=1'))
+        self.assertIndexed(lambda: self.get('/shows?venue_id=%d' % self.venue_id))
+        self.assertIndexed(lambda: self.get('/shows?artist_id=%d&from=2000-01-01' % self.artist_id))
+        self.assertIndexed(lambda: self.get('/shows?after=2000-01-01T00:00:00_0'))
+
+    def test_shows_keyset(self):
+        """Test following next walks every show once, in (start_time, id) order, even across equal start times"""
+        tie = datetime(2031, 1, 1, 20, 0)
+        db.session.add_all([Show(venues=self.venues[i % 2].id, artists=self.artists[i // 2].id, start_time=tie) for i in range(4)])
+        db.session.commit()
+        expected = [(venue_id, artist_id, start_time.isoformat()) for venue_id, artist_id, start_time in
+                    db.session.query(Show.venues, Show.artists, Show.start_time).order_by(Show.start_time, Show.id)]
+
+        walked = []
+        url = '/api/v1/shows?limit=2'
+        while True:
+            page = self.client.get(url).get_json()
+            self.assertLessEqual(len(page['data']), 2)
+            walked.extend((s['venue_id'], s['artist_id'], s['start_time']) for s in page['data'])
+            if page['next'] is None:
+                break
+            url = '/api/v1/shows?limit=2&after=' + page['next']
+        self.assertEqual(walked, expected)
+
+        # the HTML listing pages through the same cursor
+        res = self.client.get('/shows?limit=2')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'after=', res.data)
+
+    def test_artists_listing(self):
+        """Test /artists; it lists every artist so it may read the whole table"""
+        self.assertIndexed(lambda: self.get('/artists'), allowed=('Artist',))
+
+    def test_search(self):
+        """Test name searches; the SQLite fallback loads its in-memory index with one full read"""
+        self.assertIndexed(lambda: self.client.post('/venues/search', data={'search_term': 'Hop'}), allowed=self.on_sqlite('Venue'))
+        self.assertIndexed(lambda: self.client.post('/artists/search', data={'search_term': 'Band'}), allowed=self.on_sqlite('Artist'))
+
+    def test_trigram_index(self):
+        """Test the SQLite fallback index: case-insensitive substring hits, most similar first, kept current by put/drop"""
+        self.assertEqual(similarity('Hop', 'hop'), 1.0)
+        self.assertGreater(similarity('The Musical Hop', 'Hop'), similarity('Hopscotch Lounge', 'Hop'))
+        self.assertEqual(similarity('The Dueling Pianos Bar', 'Hop'), 0.0)
+
+        index = TrigramIndex()
+        index.load([(1, 'The Musical Hop'), (2, 'Hopscotch Lounge'), (3, 'Hop'), (4, 'The Dueling Pianos Bar')])
+        self.assertEqual(index.search('HOP', 10), (3, [3, 1, 2]))
+        self.assertEqual(index.search('hop', 1, offset=1), (3, [1]))
+        self.assertEqual(index.search('usica', 10), (1, [1]))
+        index.drop(3)
+        index.put(2, 'Lounge')
+        self.assertEqual(index.search('hop', 10), (1, [1]))
+
+    def test_name_search(self):
+        """Test venue search ranks the closest names first and counts every hit, one page at a time"""
+        db.session.add_all([Venue(name='Hop', city='Austin', state='TX'), Venue(name='Hopscotch Lounge', city='Austin', state='TX')])
+        db.session.commit()
+        total, hits = search_by_name(Venue, 'hop', per_page=2)
+        self.assertEqual(total, 3)
+        self.assertEqual([hit['name'] for hit in hits], ['Hop', 'The Musical Hop'])
+        total, hits = search_by_name(Venue, 'hop', page=2, per_page=2)
+        self.assertEqual((total, [hit['name'] for hit in hits]), (3, ['Hopscotch Lounge']))
+        self.assertEqual(search_by_name(Venue, 'hop', page=3, per_page=2), (3, []))
+        self.assertEqual(search_by_name(Venue, 'nothing like it'), (0, []))
+
+    def test_search_everything(self):
+        """Test /search merges venues, artists and areas into one list ranked by similarity, with their show counts"""
+        db.session.add(Venue(name='Saxophone Club', city='Saxonburg', state='PA'))
+        db.session.commit()
+        refresh_areas()
+        db.session.commit()
+
+        results = self.client.get('/api/v1/search?q=sax').get_json()
+        self.assertEqual(results['counts'], {'venue': 1, 'artist': 1, 'area': 1})
+        self.assertEqual(results['count'], 3)
+        hits = {hit['type']: hit for hit in results['data']}
+        self.assertEqual(hits['venue']['name'], 'Saxophone Club')
+        self.assertEqual(hits['artist']['name'], 'The Wild Sax Band')
+        self.assertEqual(hits['artist']['num_upcoming_shows'], self.artists[1].upcoming_shows_count)
+        self.assertEqual((hits['area']['name'], hits['area']['num_venues']), ('Saxonburg, PA', 1))
+        scores = [hit['score'] for hit in results['data']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        page = self.client.post('/search', data={'search_term': 'sax'})
+        self.assertEqual(page.status_code, 200)
+        for name in (b'Saxophone Club', b'The Wild Sax Band', b'Saxonburg, PA'):
+            self.assertIn(name, page.data)
+
+    def test_genre_filter(self):
+        """Test the bitmask filter; Postgres answers it from the (genre_mask, id) index"""
+        self.assertIndexed(lambda: self.get('/venues/genres?genre=Jazz&genre=Folk&match=all'), allowed=self.on_sqlite('Venue'))
+
+    def test_show_creation(self):
+        """Test creating a show only touches rows by key"""
+        form = {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': '2030-01-01 20:00:00'}
+        self.assertIndexed(lambda: self.client.post('/shows/create', data=form))
+
+    def test_show_batch(self):
+        """Test batch scheduling checks both sides' bookings through the index and is all-or-nothing"""
+        shows = [
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': '2030-01-01 20:00:00'},
+            {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': '2030-01-02 20:00:00'},
+        ]
+        self.assertIndexed(lambda: self.client.post('/shows/batch', json={'shows': shows}))
+
+        clash = [{'venue_id': self.venues[1].id, 'artist_id': self.artist_id, 'start_time': '2030-01-05 20:00:00'},
+                 {'venue_id': self.venue_id, 'artist_id': self.artists[1].id, 'start_time': '2030-01-01 21:00:00'}]
+        res = self.client.post('/shows/batch', json={'shows': clash})
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual([c['show'] for c in res.get_json()['conflicts']], [1])
+        self.assertEqual(Show.query.count(), 5)
+
+        # the artist's shows go with it, so they no longer hold the venue
+        self.client.delete('/artists/%d' % self.artist_id)
+        res = self.client.post('/shows/batch', json={'shows': clash[1:]})
+        self.assertEqual(res.status_code, 200)
+
+    def test_venue_deletion(self):
+        """Test deleting a venue hides it and its shows everywhere, and the purge finds them through the indexes"""
+        counts = db.session.query(Artist.upcoming_shows_count, Artist.past_shows_count).filter(Artist.id == self.artists[1].id)
+        upcoming, past = counts.one()
+        self.assertIndexed(lambda: self.client.delete('/venues/%d' % self.venue_id))
+        self.assertEqual(self.client.get('/venues/%d' % self.venue_id).status_code, 404)
+        # its upcoming show with the other artist comes off that artist's counter at once, and only once
+        self.assertEqual(counts.one(), (upcoming - 1, past))
+        # a second delete, e.g. a retried or concurrent request, finds nothing live to take off
+        self.assertIsNone(soft_delete(Venue, self.venue_id))
+        self.client.delete('/venues/%d' % self.venue_id)
+        self.assertEqual(counts.one(), (upcoming - 1, past))
+        self.assertEqual(self.client.get('/api/v1/shows?venue_id=%d' % self.venue_id).get_json()['data'], [])
+        self.assertEqual(Show.query.count(), 3)
+
+        self.assertIndexed(lambda: purge_deleted(batch_size=1))
+        self.assertIsNone(Venue.query.get(self.venue_id))
+        self.assertEqual(Show.query.count(), 1)
+        self.assertEqual(VenueGenre.query.count(), 0)
+        self.assertEqual(counts.one(), (upcoming - 1, past))
+
+    def test_api_dates(self):
+        """Test the detail endpoint writes show times as ISO 8601, like the listings"""
+        listed = self.client.get('/api/v1/shows?venue_id=%d' % self.venue_id).get_json()['data']
+        detail = self.client.get('/api/v1/venues/%d?fields=name,past_shows,upcoming_shows' % self.venue_id).get_json()['data']
+        start_times = [s['start_time'] for s in detail['past_shows'] + detail['upcoming_shows']]
+        self.assertEqual(sorted(start_times), sorted(s['start_time'] for s in listed))
+        for start_time in start_times:
+            self.assertEqual(datetime.fromisoformat(start_time).isoformat(), start_time)
+
+    def test_bad_cursor(self):
+        """Test a malformed ?after= is a plain 400 that does not echo the parser's error"""
+        for cursor in ('nonsense', '2020-13-45T00:00:00_1', '2020-01-01T00:00:00_x'):
+            res = self.client.get('/api/v1/shows?after=' + cursor)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(res.get_json()['message'], 'Invalid cursor.')
+            self.assertEqual(self.client.get('/shows?after=' + cursor).status_code, 400)
+
+    def test_read_your_writes(self):
+        """Test a client's GETs read from the primary for a while after it writes, and from the replica otherwise"""
+        binds = app.config['SQLALCHEMY_BINDS']
+        # the replica is the same database here; only the engine it is reached through differs
+        app.config['SQLALCHEMY_BINDS'] = dict(binds or {}, replica=app.config['SQLALCHEMY_DATABASE_URI'])
+        try:
+            replica = db.get_engine(app, bind='replica')
+            with app.test_request_context('/shows'):
+                self.assertIs(db.session.get_bind(), replica)
+            with app.test_request_context('/shows', method='POST'):
+                self.assertIsNot(db.session.get_bind(), replica)
+
+            self.client.get('/shows')
+            with self.client.session_transaction() as sess:
+                self.assertNotIn('read_primary_until', sess)
+            form = {'venue_id': self.venue_id, 'artist_id': self.artist_id, 'start_time': '2030-01-01 20:00:00'}
+            self.client.post('/shows/create', data=form)
+            with self.client.session_transaction() as sess:
+                until = sess['read_primary_until']
+            with app.test_request_context('/shows'):
+                session['read_primary_until'] = until
+                self.assertIsNot(db.session.get_bind(), replica)
+                session['read_primary_until'] = until - app.config['READ_PRIMARY_AFTER_WRITE']
+                self.assertIs(db.session.get_bind(), replica)
+        finally:
+            db.session.remove()
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+    def import_venues(self, rows, batch_size):
+        body = '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+        res = self.client.post('/import/venues?batch_size=%d' % batch_size, data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()
+
+    def import_row(self, name, **values):
+        row = {'name': name, 'city': 'Reno', 'state': 'NV', 'address': '1 Virginia Street', 'genres': ['Jazz'],
+               'facebook_link': 'https://www.facebook.com/reno', 'website': 'https://reno.example.com'}
+        row.update(values)
+        return row
+
+    def test_import_errors(self):
+        """Test invalid import rows are reported by line while the valid rows of their batch are written"""
+        report = self.import_venues([
+            self.import_row('Reno One'),
+            self.import_row('Bad State', state='ZZ'),
+            '{not json',
+            self.import_row('Reno Two'),
+            self.import_row('Bad Genre', genres=['Jazz', 'Swing']),
+        ], batch_size=2)
+        self.assertEqual((report['rows'], report['imported'], report['failed']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 5])
+        self.assertIn('state', report['errors'][0]['errors'])
+        self.assertIn('genres', report['errors'][2]['errors'])
+        self.assertEqual(sorted(name for (name,) in db.session.query(Venue.name).filter(Venue.city == 'Reno')), ['Reno One', 'Reno Two'])
+
+    def test_import_batch_rollback(self):
+        """Test a batch whose write fails is rolled back whole and reported row by row, the other batches kept"""
+        rows = [self.import_row('Reno %d' % n) for n in range(4)]
+        # the second batch fails after its venues are inserted, when it updates the area rollup
+        with mock.patch('app.bump_area', side_effect=[None, RuntimeError('area rollup failed')]):
+            report = self.import_venues(rows, batch_size=2)
+        self.assertEqual((report['imported'], report['failed']), (2, 2))
+        self.assertEqual([(error['line'], list(error['errors'])) for error in report['errors']], [(3, ['batch']), (4, ['batch'])])
+        self.assertEqual(sorted(name for (name,) in db.session.query(Venue.name).filter(Venue.city == 'Reno')), ['Reno 0', 'Reno 1'])
+        self.assertEqual(VenueGenre.query.join(Venue).filter(Venue.city == 'Reno').count(), 2)
+
+    def test_areas(self):
+        """Test the area rollup is read through its activity index and follows venue writes"""
+        refresh_areas()
+        db.session.commit()
+        self.assertIndexed(lambda: self.get('/api/v1/areas'))
+        self.assertIndexed(lambda: self.get('/api/v1/areas?state=CA'))
+
+        self.client.delete('/venues/%d' % self.venues[1].id)
+        form = {'name': 'Park Square Live Music & Coffee', 'city': 'San Francisco', 'state': 'CA', 'address': '34 Whiskey Moore Ave',
+                'phone': '', 'image_link': '', 'website': '', 'facebook_link': '', 'seeking_description': ''}
+        self.client.post('/venues/create', data=form)
+        areas = self.client.get('/api/v1/areas').get_json()['data']
+        self.assertEqual([(a['city'], a['num_venues']) for a in areas], [('San Francisco', 2)])
+
+    def test_rollover(self):
+        """Test the rollover job finds started shows through the index"""
+        self.assertIndexed(rollover_shows)
+
+    def assertWithinBudget(self, max_queries, fn):
+        profiler = app.extensions.get('query_profiler')
+        if profiler is None:
+            self.skipTest('flask_query_profiler is not installed')
+        with profiler.budget(max_queries) as profiles:
+            fn()
+        self.assertTrue(profiles)
+
+    def test_pages_query_budget(self):
+        """Test listing and detail pages run a fixed number of queries, whatever the number of shows"""
+        self.assertWithinBudget(1, lambda: self.get('/venues'))
+        self.assertWithinBudget(2, lambda: self.get('/venues/%d' % self.venue_id))
+        self.assertWithinBudget(2, lambda: self.get('/artists/%d' % self.artist_id))
+        self.assertWithinBudget(1, lambda: self.get('/shows'))
+
+    def test_concurrent_detail_reads(self):
+        """Test the detail pages render the same when the row and timeline are read side by side"""
+        for url in ('/venues/%d' % self.venue_id, '/artists/%d' % self.artists[1].id, '/venues/0'):
+            page_cache.backend.clear()
+            sequential = self.client.get(url)
+            page_cache.backend.clear()
+            app.config['CONCURRENT_DETAIL_READS'] = True
+            try:
+                concurrent = self.client.get(url)
+            finally:
+                app.config['CONCURRENT_DETAIL_READS'] = False
+            self.assertEqual(concurrent.status_code, sequential.status_code)
+            self.assertEqual(concurrent.data, sequential.data)
+
+    def queries(self, fn):
+        n = [0]
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            n[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        return n[0], result
+
+    def clear_flashes(self):
+        # the redirect target would skip the cache while the write's flash message is pending
+        with self.client.session_transaction() as flask_session:
+            flask_session.pop('_flashes', None)
+
+    def test_page_cache_hit(self):
+        """Test a cached page is served without queries and answers a matching If-None-Match with 304"""
+        url = '/artists/%d' % self.artist_id
+        n, first = self.queries(lambda: self.client.get(url))
+        self.assertGreater(n, 0)
+        self.assertTrue(first.headers.get('ETag'))
+        self.assertIn('Accept-Language', first.headers['Vary'])
+
+        n, second = self.queries(lambda: self.client.get(url))
+        self.assertEqual(n, 0)
+        self.assertEqual(second.data, first.data)
+
+        res = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_page_cache_streamed(self):
+        """Test a streamed page is still streamed on a miss, then cached once it was sent whole"""
+        first = self.client.get('/venues')
+        self.assertTrue(first.is_streamed)
+        self.assertIsNone(first.headers.get('ETag'))
+        self.assertTrue(first.data)
+        n, second = self.queries(lambda: self.client.get('/venues'))
+        self.assertEqual(n, 0)
+        self.assertEqual(second.data, first.data)
+        self.assertTrue(second.headers.get('ETag'))
+
+    def test_page_cache_invalidation(self):
+        """Test creating, editing and deleting drop the cached pages through their version scopes"""
+        etag = self.client.get('/artists/%d' % self.artist_id).headers['ETag']
+        form = {'name': 'Guns N Roses', 'city': 'San Francisco', 'state': 'CA', 'phone': '', 'image_link': '',
+                'website': '', 'facebook_link': '', 'seeking_description': '', 'genres': 'Rock_n_Roll'}
+        self.client.post('/artists/%d/edit' % self.artist_id, data=form)
+        self.clear_flashes()
+        res = self.client.get('/artists/%d' % self.artist_id, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Roses', res.data)
+
+        listing = self.client.get('/artists').data
+        self.client.post('/artists/create', data=dict(form, name='The Fame Monster'))
+        self.clear_flashes()
+        self.assertIn(b'The Fame Monster', self.client.get('/artists').data)
+        self.assertNotIn(b'The Fame Monster', listing)
+
+        venue_page = '/venues/%d' % self.venue_id
+        self.client.get(venue_page)
+        self.client.delete(venue_page)
+        self.assertEqual(self.client.get(venue_page).status_code, 404)
+
+    def test_page_cache_skipped_with_flashes(self):
+        """Test a page with pending flash messages is neither served from nor stored in the cache"""
+        url = '/artists/%d' % self.artist_id
+        with self.client.session_transaction() as flask_session:
+            flask_session['_flashes'] = [('message', 'Artist was successfully listed!')]
+        res = self.client.get(url)
+        self.assertIsNone(res.headers.get('ETag'))
+
+        n, res = self.queries(lambda: self.client.get(url))
+        self.assertGreater(n, 0)
+        self.assertTrue(res.headers.get('ETag'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,82 @@
+import io
 import os
-from flask import Flask, request, abort, jsonify
+import random
+import uuid
+import click
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import setup_db, db, Question, create_index
+from flaskr.cache import TTLCache
+from flaskr.categories import CategoryCache
+from flaskr.search import search_questions
+from flaskr.transfer import FORMATS, export_questions, file_format, import_questions, read_rows
+from flaskr.quiz import Deck, QuizSession, is_correct
+from flaskr.sessions import backend_from_url
+
+try:
+  from flask_query_profiler import QueryProfiler
+except ImportError:
+  # optional, see /QueryProfiler
+  QueryProfiler = None
 
 QUESTIONS_PER_PAGE = 10
+# largest ?per_page= a client may ask for
+MAX_QUESTIONS_PER_PAGE = 100
+# seconds another worker's category writes take to show up here
+CATEGORY_CACHE_TTL = 300
+# questions written per transaction by the bulk import, and the most a client may ask for
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_BATCH_SIZE = 10000
+# seconds a question count is reused before it is queried again
+QUESTION_COUNT_TTL = 60
+# seconds a category's quiz deck (its question ids) is reused
+QUIZ_DECK_TTL = 300
+# quiz sessions kept by the memory backend; the least recently played go first
+MAX_QUIZ_SESSIONS = 10000
+# where quiz sessions live: 'memory' or a redis:// url shared by all workers
+QUIZ_SESSION_BACKEND = os.environ.get('QUIZ_SESSION_BACKEND', 'memory')
+# seconds an idle quiz session is kept
+QUIZ_SESSION_TTL = 3600
+# questions per quiz, and the most a client may ask for
+QUIZ_LENGTH = 5
+MAX_QUIZ_LENGTH = 50
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  app.config.from_mapping(
+    QUESTIONS_PER_PAGE=QUESTIONS_PER_PAGE,
+    MAX_QUESTIONS_PER_PAGE=MAX_QUESTIONS_PER_PAGE,
+    CATEGORY_CACHE_TTL=CATEGORY_CACHE_TTL,
+    IMPORT_BATCH_SIZE=IMPORT_BATCH_SIZE,
+    MAX_IMPORT_BATCH_SIZE=MAX_IMPORT_BATCH_SIZE,
+    QUESTION_COUNT_TTL=QUESTION_COUNT_TTL,
+    QUIZ_DECK_TTL=QUIZ_DECK_TTL,
+    MAX_QUIZ_SESSIONS=MAX_QUIZ_SESSIONS,
+    QUIZ_SESSION_BACKEND=QUIZ_SESSION_BACKEND,
+    QUIZ_SESSION_TTL=QUIZ_SESSION_TTL,
+    QUIZ_LENGTH=QUIZ_LENGTH,
+    MAX_QUIZ_LENGTH=MAX_QUIZ_LENGTH,
+    # per-request query counts and Server-Timing headers, when flask_query_profiler is installed
+    QUERY_PROFILER=app.debug,
+  )
+  app.config.from_envvar('TRIVIA_SETTINGS', silent=True)
+  if test_config:
+    app.config.update(test_config)
   setup_db(app)
+  if QueryProfiler is not None and app.config['QUERY_PROFILER']:
+    QueryProfiler(app)
+
+  categories = CategoryCache(app.config['CATEGORY_CACHE_TTL'])
+  try:
+    with app.app_context():
+      categories.load()
+  except SQLAlchemyError:
+    # database not reachable yet; the first request loads it
+    app.logger.warning('categories not loaded at startup', exc_info=True)
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -37,19 +102,19 @@ def create_app(test_config=None):
   @app.route('/categories', methods=['GET'])
   #@cross_origin()
   def get_categories():
-    categories = Category.query.all()
+    types, etag = categories.get()
 
-    if len(categories) == 0:
+    if len(types) == 0:
         abort(404)
-    
-    formatted_categories = {}
-    for cat in categories:
-        formatted_categories[getattr(cat, 'id')]= getattr(cat, 'type')
 
-    return jsonify({
+    response = jsonify({
         'success':True,
-        'categories': formatted_categories
-    });
+        'categories': types
+    })
+    # clients revalidate with If-None-Match and get an empty 304 while nothing changed
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
   '''
   @TODO: 
@@ -63,32 +128,66 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
+  question_counts = TTLCache(app.config['QUESTION_COUNT_TTL'])
+  quiz_decks = TTLCache(app.config['QUIZ_DECK_TTL'])
+  quiz_store = backend_from_url(app.config['QUIZ_SESSION_BACKEND'], app.config['MAX_QUIZ_SESSIONS'], app.config['QUIZ_SESSION_TTL'])
+
+  def questions_changed():
+    question_counts.invalidate()
+    quiz_decks.invalidate()
+
+  def questions_in(category):
+    query = Question.query
+    if category is not None:
+      query = query.filter(Question.category == category)
+    return query
+
+  def count_questions(category):
+    return question_counts.get(category,
+      lambda: questions_in(category).with_entities(db.func.count(Question.id)).scalar())
+
+  def question_page(category):
+    '''
+    One page of questions, optionally of one category, read with LIMIT in the database.
+      ?page=N            numbered pages (OFFSET; fine for the first few thousand rows)
+      ?after=<id>        the page after question <id>; stays fast however deep, use 'next'
+      ?per_page=M        page size, up to MAX_QUESTIONS_PER_PAGE
+    '''
+    per_page = request.args.get('per_page', app.config['QUESTIONS_PER_PAGE'], type=int)
+    per_page = min(max(per_page, 1), app.config['MAX_QUESTIONS_PER_PAGE'])
+    page = max(request.args.get('page', 1, type=int), 1)
+    after = request.args.get('after', type=int)
+
+    query = questions_in(category).order_by(Question.id)
+    if after is not None:
+      query = query.filter(Question.id > after)
+    else:
+      query = query.offset((page - 1) * per_page)
+    # one extra row tells whether there is a next page
+    questions = query.limit(per_page + 1).all()
+    if len(questions) == 0:
+      abort(404)
+
+    return {
+      'questions': [q.format() for q in questions[:per_page]],
+      'total_questions': count_questions(category),
+      'current_category': category,
+      'per_page': per_page,
+      'next': questions[per_page - 1].id if len(questions) > per_page else None,
+    }
+
   @app.route('/questions', methods=['GET'])
   def get_questions():
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * 10
-    end = start + 10
-
-    questions= Question.query.all()
-    formatted_questions = [q.format() for q in questions]
-    page_questions = formatted_questions[start:end]
-    if (len(page_questions) == 0):
-        abort(404)
+    result = question_page(request.args.get('category', type=int))
 
-    categories = Category.query.all()
-    if len(categories) == 0:
+    types = categories.types
+    if len(types) == 0:
         abort(404)
-    formatted_categories = {}
-    for cat in categories:
-        formatted_categories[getattr(cat, 'id')]= getattr(cat, 'type')
 
-    return jsonify({
-        'success':True,
-        'questions': page_questions,
-        'total_questions': len(page_questions),
-        'categories': formatted_categories,
-        'current_category': 1
-    })
+    return jsonify(dict(result,
+        success=True,
+        categories=types,
+    ))
 
   '''
   @TODO: 
@@ -113,6 +212,7 @@ def create_app(test_config=None):
         q= Question.query.filter_by(id=q_id).one_or_none()
         formatted_q= q.format()
         q.delete()
+        questions_changed()
         return jsonify({ 'success': True, 'q': formatted_q})
     except:
         abort(422)
@@ -137,10 +237,73 @@ def create_app(test_config=None):
         category= content['category']
         q = Question(question=question_text, answer=answer, difficulty=difficulty, category=category)
         q.insert()
+        questions_changed()
         return jsonify({ 'success': True, 'question': q.format()})
     except:
         abort(422)
 
+  '''
+  Bulk import and export, as ndjson (one question object per line) or csv
+  with a header row: question, answer, category (id or type), difficulty.
+    POST /questions/import?format=ndjson&batch_size=1000
+      curl -H 'Content-Type: application/x-ndjson' --data-binary @questions.ndjson /questions/import
+    GET /questions/export?format=csv&category=2
+  The same from the command line:
+    flask import-questions questions.ndjson
+    flask export-questions questions.csv
+  '''
+  def import_stream(stream, fmt, batch_size):
+    report = import_questions(read_rows(stream, fmt), categories.types, batch_size)
+    questions_changed()
+    return report
+
+  @app.route('/questions/import', methods=['POST'])
+  def import_q():
+    fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+    if fmt not in FORMATS:
+      abort(400)
+    batch_size = request.args.get('batch_size', app.config['IMPORT_BATCH_SIZE'], type=int)
+    batch_size = min(max(batch_size, 1), app.config['MAX_IMPORT_BATCH_SIZE'])
+    report = import_stream(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''), fmt, batch_size)
+    return jsonify(dict(report, success=True))
+
+  @app.route('/questions/export', methods=['GET'])
+  def export_q():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+      abort(400)
+    category = request.args.get('category', type=int)
+    lines = export_questions(fmt, category, app.config['IMPORT_BATCH_SIZE'])
+    return Response(stream_with_context(lines),
+      mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+      headers={'Content-Disposition': 'attachment; filename=questions.%s' % fmt})
+
+  @app.cli.command('import-questions')
+  @click.argument('source', type=click.File('r'))
+  @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+  @click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+  def import_questions_command(source, fmt, batch_size):
+    report = import_stream(source, file_format(source.name, fmt), batch_size)
+    for error in report['errors']:
+      click.echo('line %(line)s: %(errors)s' % error, err=True)
+    click.echo('%(imported)d of %(rows)d questions imported, %(duplicates)d duplicates, '
+      '%(failed)d failed in %(seconds)ss (%(rows_per_second)d rows/s)' % report)
+
+  @app.cli.command('export-questions')
+  @click.argument('target', type=click.File('w'))
+  @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+  @click.option('--category', type=int)
+  def export_questions_command(target, fmt, category):
+    for chunk in export_questions(file_format(target.name, fmt), category, app.config['IMPORT_BATCH_SIZE']):
+      target.write(chunk)
+
+  @app.cli.command('create-question-indexes')
+  def create_question_indexes_command():
+    '''Build the search and import indexes on a database created before they existed.'''
+    for name in ('questions_category_id', 'questions_search', 'questions_normalized'):
+      create_index(db.engine, name)
+      click.echo('%s ready' % name)
+
   '''
   @TODO: 
   Create a POST endpoint to get questions based on a search term. 
@@ -153,23 +316,41 @@ def create_app(test_config=None):
   '''
   @app.route('/questions/search', methods=['POST'])
   def search_q():
+    '''
+    Full text search over question and answer words, best matches first.
+      {"searchTerm": "tom han", "category": 5, "page": 1, "per_page": 10}
+    Every word of the term must start a word of the question or its answer.
+    Each question comes with its rank and snippets, hits wrapped in <mark>.
+    '''
+    content = request.get_json(silent=True) or {}
     try:
-        content = request.get_json()
-        searchTerm= content['searchTerm']
-        searchTerm= '%'+searchTerm+'%'
-        questions = Question.query.filter(Question.question.ilike(searchTerm))
-        formatted_questions = [q.format() for q in questions]
-        categories = Category.query.all()
-        formatted_categories = [cat.format() for cat in categories]
-        return jsonify({
-            'success':True,
-            'questions': formatted_questions,
-            'total_questions': len(formatted_questions),
-            'categories': formatted_categories,
-            'current_category': 1
-        })
-    except:
+        searchTerm = content['searchTerm']
+        category = int(content['category']) if content.get('category') else None
+        per_page = int(content.get('per_page', app.config['QUESTIONS_PER_PAGE']))
+        page = int(content.get('page', 1))
+    except (KeyError, TypeError, ValueError):
         abort(422)
+    if not isinstance(searchTerm, str):
+        abort(422)
+    per_page = min(max(per_page, 1), app.config['MAX_QUESTIONS_PER_PAGE'])
+    page = max(page, 1)
+
+    rows, total, has_next = search_questions(searchTerm, category, page, per_page)
+    formatted_questions = [dict(q.format(), rank=rank, snippet={
+        'question': question_snippet,
+        'answer': answer_snippet,
+    }) for q, rank, question_snippet, answer_snippet in rows]
+    return jsonify({
+        'success':True,
+        'questions': formatted_questions,
+        'total_questions': total,
+        'categories': categories.types,
+        'current_category': category,
+        'page': page,
+        'per_page': per_page,
+        'next': page + 1 if has_next else None,
+    })
+
 
   '''
   @TODO: 
@@ -181,16 +362,8 @@ def create_app(test_config=None):
   '''
   @app.route('/categories/<int:cat_id>/questions', methods=['GET'])
   def get_q_by_cat(cat_id):
-    try:
-        cat_id = cat_id
-        questions= Question.query.filter(Question.category == cat_id).all()
-        formatted_questions = [q.format() for q in questions]
-        return jsonify({
-            'success':True,
-            'questions': formatted_questions,
-        });
-    except:
-        abort(422)
+    # same pagination as /questions?category=<cat_id>
+    return jsonify(dict(question_page(cat_id), success=True))
 
   '''
   @TODO: 
@@ -203,34 +376,168 @@ def create_app(test_config=None):
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
   '''
+  def quiz_deck(category):
+    # ids only, read once per category and TTL, not per quiz step
+    return quiz_decks.get(category,
+      lambda: Deck(id for (id,) in questions_in(category).with_entities(Question.id)))
+
   @app.route('/quizzes', methods=['POST'])
   def get_quiz():
+    '''
+    The next random question the player hasn't seen, or null when the category is done.
+    Send "quiz_token": null to start a tracked quiz and the returned quiz_token to continue
+    it; previous_questions is then only needed to start one. Without a quiz_token key the
+    quiz is rebuilt from previous_questions on every call and nothing is kept here.
+    '''
     try:
         content = request.get_json()
-
-        previous_questions = content['previous_questions']
-        quiz_category_id = int(content['quiz_category']['id']);
-
-        if quiz_category_id != 0:
-            questions = Question.query.filter_by(category=quiz_category_id)
-        else:
-            questions = Question.query
-
-        possible_questions = questions.filter(Question.id.notin_(previous_questions)).all()
-        if len(previous_questions) == len(questions.all()):
-            print('game over')
-            return jsonify({
-                'success': True,
-                'question': None
-            }), 200
-        question = random.choice(possible_questions).format()
-        return jsonify({
-            'success': True,
-            'question': question,
-            'previous_questions': previous_questions,
-        }), 200
+        previous_questions = [int(q_id) for q_id in content.get('previous_questions', [])]
+        quiz_category_id = int(content['quiz_category']['id'])
     except:
         abort(422)
+    category = quiz_category_id or None
+
+    token = None
+    seen = previous_questions
+    if 'quiz_token' in content:
+        token = content['quiz_token']
+        if token is not None and not isinstance(token, str):
+            abort(422)
+        # the same store as /quizzes/start; its sessions have no 'seen' and start a new quiz here
+        stored = quiz_store.get(token) if token else None
+        if stored is None or 'seen' not in stored or stored['category'] != category:
+            token = uuid.uuid4().hex
+        else:
+            seen = stored['seen']
+    session = QuizSession(quiz_deck(category), category)
+    session.mark_ids(seen)
+
+    question = None
+    while question is None:
+        position = session.draw()
+        if position is None:
+            break
+        session.mark(position)
+        # None if deleted since the deck was built; draw again
+        question = Question.query.get(session.deck.ids[position])
+    if token is not None:
+        quiz_store.set(token, {'category': category, 'seen': session.seen_ids()})
+
+    return jsonify({
+        'success': True,
+        'question': question.format() if question is not None else None,
+        'previous_questions': previous_questions,
+        'quiz_token': token,
+    }), 200
+
+  '''
+  Quiz sessions
+    POST /quizzes/start            {"quiz_category": {"id": 0}, "length": 5} -> quiz_token
+    POST /quizzes/<token>/next     the next question, without its answer; null when done
+    POST /quizzes/<token>/answer   {"answer": "..."} -> whether it was right, and the score
+    POST /quizzes/<token>/finish   the final score; the session is gone afterwards
+  The deck is drawn and shuffled once at start, so each step pops an id and
+  reads one question by primary key.
+  '''
+  def quiz_session(token):
+    session = quiz_store.get(token)
+    # a POST /quizzes session has no deck of its own
+    if session is None or 'deck' not in session:
+      abort(404)
+    return session
+
+  def quiz_score(session):
+    return {
+      'answered': session['answered'],
+      'correct': session['correct'],
+      'total': session['total'],
+    }
+
+  @app.route('/quizzes/start', methods=['POST'])
+  def start_quiz():
+    content = request.get_json(silent=True) or {}
+    try:
+      category = int(content['quiz_category']['id']) or None
+      length = int(content.get('length', app.config['QUIZ_LENGTH']))
+    except (KeyError, TypeError, ValueError):
+      abort(422)
+    if length < 1:
+      abort(422)
+
+    ids = quiz_deck(category).ids
+    # random.sample picks <length> positions in O(length), however big the category; the
+    # deck's ids are an array, which random.sample only takes as a population from Python 3.10
+    positions = random.sample(range(len(ids)), min(length, app.config['MAX_QUIZ_LENGTH'], len(ids)))
+    deck = [ids[i] for i in positions]
+    token = uuid.uuid4().hex
+    quiz_store.set(token, {
+      'category': category,
+      'deck': deck,
+      'total': len(deck),
+      'current': None,
+      'answered': 0,
+      'correct': 0,
+    })
+    return jsonify({
+      'success': True,
+      'quiz_token': token,
+      'total': len(deck),
+    }), 201
+
+  @app.route('/quizzes/<token>/next', methods=['POST'])
+  def next_quiz_question(token):
+    session = quiz_session(token)
+    question = None
+    while question is None and session['deck']:
+      # None if deleted since the quiz started; that one doesn't count
+      question = Question.query.get(session['deck'].pop())
+      if question is None:
+        session['total'] -= 1
+    session['current'] = question.id if question is not None else None
+    quiz_store.set(token, session)
+
+    return jsonify({
+      'success': True,
+      'question': {
+        'id': question.id,
+        'question': question.question,
+        'category': question.category,
+        'difficulty': question.difficulty,
+      } if question is not None else None,
+      'remaining': len(session['deck']),
+      'score': quiz_score(session),
+    })
+
+  @app.route('/quizzes/<token>/answer', methods=['POST'])
+  def answer_quiz_question(token):
+    session = quiz_session(token)
+    content = request.get_json(silent=True) or {}
+    if session['current'] is None or not isinstance(content.get('answer'), str):
+      abort(422)
+
+    question = Question.query.get(session['current'])
+    answer = question.answer if question is not None else None
+    correct = is_correct(answer, content['answer'])
+    session['current'] = None
+    session['answered'] += 1
+    session['correct'] += int(correct)
+    quiz_store.set(token, session)
+
+    return jsonify({
+      'success': True,
+      'correct': correct,
+      'answer': answer,
+      'score': quiz_score(session),
+    })
+
+  @app.route('/quizzes/<token>/finish', methods=['POST'])
+  def finish_quiz(token):
+    session = quiz_session(token)
+    quiz_store.delete(token)
+    return jsonify({
+      'success': True,
+      'score': quiz_score(session),
+    })
 
   '''
   @TODO: 
@@ -0,0 +1,36 @@
+import threading
+import time
+
+'''
+TTLCache
+    values computed per key (question counts, quiz decks), each kept for ttl
+    seconds. Writers call invalidate() so this process sees its own writes at
+    once; other worker processes catch up within ttl.
+'''
+class TTLCache(object):
+  def __init__(self, ttl=60):
+    self.ttl = ttl
+    self._values = {}
+    self._generation = 0
+    self._lock = threading.Lock()
+
+  def get(self, key, compute):
+    # compute() runs the query on a miss
+    now = time.monotonic()
+    with self._lock:
+      hit = self._values.get(key)
+      generation = self._generation
+    if hit is not None and hit[1] > now:
+      return hit[0]
+
+    value = compute()
+    with self._lock:
+      # a write that happened while computing may not be in value
+      if generation == self._generation:
+        self._values[key] = (value, now + self.ttl)
+    return value
+
+  def invalidate(self):
+    with self._lock:
+      self._generation += 1
+      self._values.clear()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from models import db, Category
+
+# every CategoryCache in this process, told about category writes once they commit
+_caches = weakref.WeakSet()
+
+'''
+CategoryCache
+    the id -> type map every listing endpoint returns, read from the categories
+    table once and reused. version goes up each time it is (re)loaded, and etag
+    is a hash of the map, so it is the same in every worker process holding the
+    same categories.
+    Category writes committed in this process invalidate it at once; other
+    worker processes reload it after ttl seconds.
+'''
+class CategoryCache(object):
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self.version = 0
+    self._types = None
+    self._etag = None
+    self._expires = 0
+    self._generation = 0
+    self._lock = threading.Lock()
+    _caches.add(self)
+
+  def load(self):
+    with self._lock:
+      generation = self._generation
+    types = {category.id: category.type for category in Category.query.order_by(Category.id)}
+    etag = hashlib.sha1(json.dumps(sorted(types.items())).encode('utf-8')).hexdigest()
+    with self._lock:
+      # a write committed while loading may not be in types; the next get reloads
+      if generation == self._generation:
+        self._types = types
+        self._etag = etag
+        self._expires = time.monotonic() + self.ttl
+        self.version += 1
+    return types, etag
+
+  def get(self):
+    # (types, etag); types is shared, callers must not change it
+    with self._lock:
+      if self._types is not None and self._expires > time.monotonic():
+        return self._types, self._etag
+    return self.load()
+
+  @property
+  def types(self):
+    return self.get()[0]
+
+  def invalidate(self):
+    with self._lock:
+      self._generation += 1
+      self._types = None
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def category_written(mapper, connection, target):
+  object_session(target).info['categories_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_categories(session):
+  if session.info.pop('categories_changed', False):
+    for cache in list(_caches):
+      cache.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_category_writes(session):
+  session.info.pop('categories_changed', None)
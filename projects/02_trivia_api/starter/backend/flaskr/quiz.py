@@ -0,0 +1,80 @@
+import random
+import re
+from array import array
+from bisect import bisect_left
+
+# random positions tried before falling back to listing the unseen ones
+PROBES = 16
+
+# what the quiz view strips from a guess before comparing it
+GUESS_PUNCTUATION = re.compile(r'[.,/#!$%^&*;:{}=\-_`~()]')
+
+def is_correct(answer, guess):
+  # same rule as the quiz view: the cleaned guess is the answer or one of its words
+  guess = GUESS_PUNCTUATION.sub('', guess or '').strip().lower()
+  answer = (answer or '').lower()
+  return bool(guess) and (guess == answer or guess in answer.split(' '))
+
+'''
+Deck
+    the ids of one category's questions (or all of them), sorted. A quiz
+    session records the questions it has shown by their position in the deck.
+    Decks are never changed once built; sessions are stored as question ids,
+    so a rebuilt deck can't shift anything under a running quiz.
+'''
+class Deck(object):
+  def __init__(self, ids):
+    self.ids = array('q', sorted(ids))
+
+  def __len__(self):
+    return len(self.ids)
+
+  def position(self, question_id):
+    i = bisect_left(self.ids, question_id)
+    if i < len(self.ids) and self.ids[i] == question_id:
+      return i
+    return None
+
+'''
+QuizSession
+    one step of a player's walk through a deck, rebuilt from the stored ids
+    of the questions shown so far; seen holds their positions, so a session
+    costs what its quiz has asked, not the size of the deck.
+'''
+class QuizSession(object):
+  def __init__(self, deck, category):
+    self.deck = deck
+    self.category = category
+    self.seen = set()
+
+  @property
+  def seen_count(self):
+    return len(self.seen)
+
+  def is_seen(self, position):
+    return position in self.seen
+
+  def mark(self, position):
+    self.seen.add(position)
+
+  def mark_ids(self, question_ids):
+    for question_id in question_ids:
+      position = self.deck.position(question_id)
+      if position is not None:
+        self.mark(position)
+
+  def seen_ids(self):
+    return [self.deck.ids[position] for position in sorted(self.seen)]
+
+  def draw(self, rng=random):
+    # a random unseen position, or None when the deck is done. Random probes find one in
+    # O(1) expected time until most of the deck is seen; only then are the unseen listed.
+    n = len(self.deck)
+    if self.seen_count >= n:
+      return None
+    for _ in range(PROBES):
+      position = rng.randrange(n)
+      if not self.is_seen(position):
+        return position
+    unseen = [position for position in range(n) if not self.is_seen(position)]
+    return rng.choice(unseen)
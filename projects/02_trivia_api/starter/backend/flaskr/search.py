@@ -0,0 +1,64 @@
+import re
+
+from sqlalchemy import func, literal
+
+from models import db, Question, question_document, SEARCH_CONFIG
+
+WORD = re.compile(r'\w+', re.UNICODE)
+# ts_headline marks every hit; questions and answers are short enough to return whole
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, HighlightAll=TRUE'
+
+def prefix_query(term):
+  # 'tom han' -> "'tom':* & 'han':*": every word must start a word of the question or answer
+  words = WORD.findall(term.lower())
+  if not words:
+    return None
+  return ' & '.join("'%s':*" % word for word in words)
+
+'''
+search_questions(term, category, page, per_page)
+    one page of the questions matching term, best first, as (rows, total, has_next).
+    Each row is (question, rank, question snippet, answer snippet). The match runs
+    on the questions_search GIN index; the rank is computed for matches only and the
+    snippets for the returned page only. A term without words lists every question.
+'''
+def search_questions(term, category=None, page=1, per_page=10):
+  query = prefix_query(term)
+  matches = db.session.query(Question.id)
+  if category is not None:
+    matches = matches.filter(Question.category == category)
+
+  if query is not None:
+    document = question_document()
+    tsquery = func.to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank_cd(document, tsquery)
+    matches = matches.filter(document.op('@@')(tsquery))
+    order = [rank.desc(), Question.id]
+  else:
+    tsquery = None
+    rank = literal(0.0)
+    order = [Question.id]
+
+  # the total rides along with the page as a window count, so it is one round trip
+  page_rows = matches.add_columns(
+    rank.label('rank'),
+    func.count().over().label('total'),
+  ).order_by(*order).offset((page - 1) * per_page).limit(per_page + 1).subquery()
+
+  if tsquery is not None:
+    snippets = [
+      func.ts_headline(SEARCH_CONFIG, Question.question, tsquery, HEADLINE_OPTIONS),
+      func.ts_headline(SEARCH_CONFIG, Question.answer, tsquery, HEADLINE_OPTIONS),
+    ]
+  else:
+    snippets = [Question.question, Question.answer]
+  rows = db.session.query(Question, page_rows.c.rank, *snippets, page_rows.c.total) \
+    .join(page_rows, Question.id == page_rows.c.id) \
+    .order_by(page_rows.c.rank.desc(), Question.id).all()
+
+  if rows:
+    total = rows[0][-1]
+  else:
+    # past the last page; the window count had no row to ride on
+    total = matches.with_entities(func.count(Question.id)).scalar()
+  return [row[:-1] for row in rows[:per_page]], total, len(rows) > per_page
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+'''
+Quiz session stores
+    a session is a plain dict (see get_quiz() and start_quiz() in
+    flaskr/__init__.py) kept under its token for ttl seconds after the last write.
+
+    MemoryBackend  per process, at most max_sessions, least recently used go first
+    RedisBackend   shared by every worker process, e.g. redis://localhost:6379/0
+'''
+class MemoryBackend(object):
+  def __init__(self, max_sessions=10000, ttl=3600):
+    self.max_sessions = max_sessions
+    self.ttl = ttl
+    self._sessions = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, token):
+    now = time.monotonic()
+    with self._lock:
+      entry = self._sessions.get(token)
+      if entry is None:
+        return None
+      if entry[1] <= now:
+        del self._sessions[token]
+        return None
+      self._sessions.move_to_end(token)
+      # a copy, so callers change the session only through set()
+      return json.loads(entry[0])
+
+  def set(self, token, session):
+    with self._lock:
+      self._sessions[token] = (json.dumps(session), time.monotonic() + self.ttl)
+      self._sessions.move_to_end(token)
+      while len(self._sessions) > self.max_sessions:
+        self._sessions.popitem(last=False)
+
+  def delete(self, token):
+    with self._lock:
+      self._sessions.pop(token, None)
+
+
+class RedisBackend(object):
+  def __init__(self, client, ttl=3600, prefix='trivia:quiz:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def get(self, token):
+    value = self.client.get(self.prefix + token)
+    return json.loads(value) if value is not None else None
+
+  def set(self, token, session):
+    self.client.set(self.prefix + token, json.dumps(session), ex=self.ttl)
+
+  def delete(self, token):
+    self.client.delete(self.prefix + token)
+
+
+def backend_from_url(url, max_sessions=10000, ttl=3600):
+  # 'memory' or a redis:// url
+  if url.startswith(('redis://', 'rediss://', 'unix://')):
+    import redis
+    return RedisBackend(redis.Redis.from_url(url), ttl)
+  if url == 'memory':
+    return MemoryBackend(max_sessions, ttl)
+  raise ValueError('Unknown quiz session backend %r' % url)
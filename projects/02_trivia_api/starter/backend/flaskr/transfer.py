@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from models import db, Question, normalized_question, normalize_questions
+
+FORMATS = ('ndjson', 'csv')
+FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+# row errors listed in an import's report; the rest are only counted
+MAX_ERRORS = 1000
+
+def read_rows(stream, fmt):
+  if fmt == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  elif fmt == 'ndjson':
+    for line_num, line in enumerate(stream, 1):
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError as e:
+        row = e
+      yield line_num, row
+  else:
+    raise ValueError('Unknown format %r, expected one of %s' % (fmt, ', '.join(FORMATS)))
+
+def file_format(filename, fmt=None):
+  if fmt:
+    return fmt
+  return 'csv' if filename.endswith('.csv') else 'ndjson'
+
+def batched(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    batch = list(islice(iterator, size))
+    if not batch:
+      return
+    yield batch
+
+def category_lookup(categories):
+  # a row may name its category by id or by type; both map to the id
+  lookup = {str(id): id for id in categories}
+  lookup.update((type.lower(), id) for id, type in categories.items())
+  return lookup
+
+def validate_row(row, categories):
+  # categories comes from category_lookup(); returns the insert values or raises ValueError(errors)
+  if not isinstance(row, dict):
+    raise ValueError({'row': [str(row) or 'Expected an object.']})
+  errors = {}
+  values = {}
+  for field in ('question', 'answer'):
+    value = row.get(field)
+    if not isinstance(value, str) or not value.strip():
+      errors[field] = ['This field is required.']
+    else:
+      values[field] = value.strip()
+
+  category = row.get('category')
+  values['category'] = categories.get(str(category).strip().lower())
+  if values['category'] is None:
+    errors['category'] = ['Unknown category %s.' % category]
+
+  # a whole number, or its digits in a csv cell; not true (== 1) or 1.9 (int() would make it 1)
+  difficulty = row.get('difficulty')
+  if isinstance(difficulty, str) and difficulty.strip().isdecimal():
+    difficulty = int(difficulty)
+  values['difficulty'] = difficulty if type(difficulty) is int else None
+  if values['difficulty'] not in DIFFICULTIES:
+    errors['difficulty'] = ['Expected a difficulty from %d to %d.' % (DIFFICULTIES[0], DIFFICULTIES[-1])]
+
+  if errors:
+    raise ValueError(errors)
+  return values
+
+'''
+import_questions(rows, categories, batch_size)
+    writes (line number, row) pairs a committed batch at a time and returns the
+    report. A question whose normalized text is already stored, or earlier in
+    its batch, is skipped as a duplicate; both are compared by keys from
+    normalize_questions(), so they agree however the database folds case.
+'''
+def import_questions(rows, categories, batch_size=1000):
+  # categories is the id -> type map
+  started = time.time()
+  report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+  categories = category_lookup(categories)
+
+  def error(line_num, errors):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_ERRORS:
+      report['errors'].append({'line': line_num, 'errors': errors})
+
+  for batch in batched(rows, batch_size):
+    valid = []
+    for line_num, row in batch:
+      report['rows'] += 1
+      try:
+        valid.append((line_num, validate_row(row, categories)))
+      except ValueError as e:
+        error(line_num, e.args[0])
+    if not valid:
+      continue
+
+    records = {}
+    duplicates = 0
+    try:
+      for key, (line_num, values) in zip(normalize_questions(values['question'] for _, values in valid), valid):
+        if key in records:
+          duplicates += 1
+        else:
+          records[key] = (line_num, values)
+      stored = db.session.query(normalized_question()).filter(normalized_question().in_(list(records)))
+      for (key,) in stored:
+        if records.pop(key, None) is not None:
+          duplicates += 1
+      if records:
+        db.session.execute(Question.__table__.insert(), [values for _, values in records.values()])
+      db.session.commit()
+    except Exception as e:
+      db.session.rollback()
+      for line_num, _ in valid:
+        error(line_num, {'batch': ['%s: %s' % (e.__class__.__name__, e)]})
+      continue
+    report['duplicates'] += duplicates
+    report['imported'] += len(records)
+
+  seconds = time.time() - started
+  report['seconds'] = round(seconds, 3)
+  report['rows_per_second'] = int(report['rows'] / seconds) if seconds else report['rows']
+  return report
+
+'''
+export_questions(fmt, category, batch_size)
+    every question, or one category's, as chunks of ndjson or csv text, read in
+    batches by id.
+'''
+def export_questions(fmt, category=None, batch_size=1000):
+  if fmt not in FORMATS:
+    raise ValueError('Unknown format %r, expected one of %s' % (fmt, ', '.join(FORMATS)))
+  columns = [getattr(Question, field) for field in FIELDS]
+  if fmt == 'csv':
+    yield ','.join(FIELDS) + '\r\n'
+  after = 0
+  while True:
+    query = db.session.query(*columns).filter(Question.id > after)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    rows = query.order_by(Question.id).limit(batch_size).all()
+    if not rows:
+      return
+    if fmt == 'csv':
+      out = io.StringIO()
+      csv.writer(out).writerows(rows)
+      yield out.getvalue()
+    else:
+      yield ''.join(json.dumps(dict(zip(FIELDS, row))) + '\n' for row in rows)
+    after = rows[-1][0]
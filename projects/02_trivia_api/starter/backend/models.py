@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, Index, create_engine, func, select, column, text
+from sqlalchemy.schema import CreateIndex
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -25,6 +26,10 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # category filter + keyset pagination on id
+    Index('questions_category_id', 'category', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
@@ -58,6 +63,59 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+question_document()
+    the text search document of a question: its question words weighted A and
+    its answer words weighted B, so a hit in the question ranks higher. The
+    'simple' configuration only lower-cases, so names and short words like
+    'who' stay searchable. Queries must use this exact expression for the GIN
+    index below to apply.
+'''
+SEARCH_CONFIG = 'simple'
+
+def question_document():
+  return func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(Question.question, '')), 'A').op('||')(
+    func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(Question.answer, '')), 'B'))
+
+Index('questions_search', question_document(), postgresql_using='gin')
+
+'''
+normalized_question(question)
+    the question text as the bulk import compares it: lower-cased, every run of
+    non-alphanumerics collapsed to one space, trimmed. The btree index below
+    makes the per-batch duplicate lookup an index scan.
+'''
+def normalized_question(question=Question.question):
+  return func.btrim(func.regexp_replace(func.lower(func.coalesce(question, '')), '[^[:alnum:]]+', ' ', 'g'))
+
+Index('questions_normalized', normalized_question())
+
+'''
+normalize_questions(texts)
+    normalized_question() of each text, in order, in one round trip. The keys
+    come from the database, so what counts as a letter and how it is lower-cased
+    (the database's locale) is the same as in the index they are looked up in.
+'''
+def normalize_questions(texts):
+  rows = db.session.execute(
+    select([normalized_question(column('t'))])
+      .select_from(text('unnest(CAST(:texts AS text[])) WITH ORDINALITY AS u(t, n)'))
+      .order_by(column('n')),
+    {'texts': list(texts)})
+  return [key for (key,) in rows]
+
+'''
+create_index(engine, name)
+    builds one of the indexes above on a database created before it existed,
+    CONCURRENTLY so the questions table stays writable meanwhile.
+'''
+def create_index(engine, name):
+  index = next(index for index in Question.__table__.indexes if index.name == name)
+  ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+  ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1)
+  with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+    connection.execute(ddl)
+
 '''
 Category
 
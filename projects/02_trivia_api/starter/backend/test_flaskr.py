@@ -4,7 +4,7 @@ import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -43,6 +43,40 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(len(data['questions']))
 
+    def test_questions_total_and_page_size(self):
+        """Test total_questions counts every question, not just the page"""
+        res = self.client().get('/questions?per_page=5')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 5)
+        self.assertGreater(data['total_questions'], 5)
+        self.assertEqual(data['next'], data['questions'][-1]['id'])
+
+    def test_questions_keyset_pages(self):
+        """Test walking the questions with ?after= visits each question once, in id order"""
+        seen = []
+        after = 0
+        while after is not None:
+            res = self.client().get('/questions?per_page=4&after=%d' % after)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            seen.extend(q['id'] for q in data['questions'])
+            after = data['next']
+
+        self.assertEqual(seen, sorted(set(seen)))
+        self.assertEqual(len(seen), data['total_questions'])
+
+    def test_questions_category_filter(self):
+        """Test ?category= filters the page and its total"""
+        res = self.client().get('/questions?category=2')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 2)
+        self.assertEqual(data['total_questions'], len(data['questions']))
+        self.assertTrue(all(q['category'] == 2 for q in data['questions']))
+
     def test_404_if_page_invalid(self):
         """Test if 404 is returned when page does not exist"""
         res = self.client().get('/questions\?page\=1000')
@@ -62,6 +96,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['categories'])
         self.assertTrue(len(data['categories']))
 
+    def test_categories_not_modified(self):
+        """Test /categories answers 304 to a current ETag"""
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_categories_cache_invalidated(self):
+        """Test a committed category write shows up in /categories at once"""
+        etag = self.client().get('/categories').headers['ETag']
+        with self.app.app_context():
+            category = Category(type='Music')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+
+        try:
+            res = self.client().get('/categories', headers={'If-None-Match': etag})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['categories'][str(category_id)], 'Music')
+            self.assertEqual(json.loads(self.client().get('/questions').data)['categories'], data['categories'])
+        finally:
+            with self.app.app_context():
+                db.session.delete(Category.query.get(category_id))
+                db.session.commit()
+        self.assertNotIn(str(category_id), json.loads(self.client().get('/categories').data)['categories'])
+
     def test_question(self):
         """Test individual question"""
         res = self.client().get('/questions/2')
@@ -132,6 +196,7 @@ class TriviaTestCase(unittest.TestCase):
         """Test question search"""
         search_data= {
             'searchTerm':'Who',
+            'category': 4,
         }
         res = self.client().post('/questions/search', json=search_data)
         data = json.loads(res.data)
@@ -141,7 +206,34 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['total_questions'])
         self.assertTrue(data['categories'])
-        self.assertTrue(data['current_category'])
+        self.assertEqual(data['current_category'], 4)
+        self.assertTrue(all(q['category'] == 4 for q in data['questions']))
+
+    def test_search_ranked_snippets(self):
+        """Test search matches word prefixes in answers too, ranks and marks the hits"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'penicil'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['answer'], 'Alexander Fleming')
+        self.assertIn('<mark>penicillin</mark>', data['questions'][0]['snippet']['question'])
+        self.assertTrue(data['questions'][0]['rank'] > 0)
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'fleming'})
+        data = json.loads(res.data)
+        self.assertEqual(data['questions'][0]['snippet']['answer'], 'Alexander <mark>Fleming</mark>')
+
+    def test_search_pages(self):
+        """Test search pages hold per_page questions and link the next page"""
+        res = self.client().post('/questions/search', json={'searchTerm': '', 'per_page': 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['questions']), 2)
+        self.assertEqual(data['next'], 2)
+        res = self.client().post('/questions/search', json={'searchTerm': '', 'per_page': 2, 'page': 2})
+        second = json.loads(res.data)
+        self.assertFalse({q['id'] for q in data['questions']} & {q['id'] for q in second['questions']})
+        self.assertEqual(second['total_questions'], data['total_questions'])
 
     def test_404_invalid_search(self):
         """Test if 404 is returned with invalid search data"""
@@ -155,6 +247,92 @@ class TriviaTestCase(unittest.TestCase):
         self.assertFalse(data['success'])
         self.assertTrue(data['message'])
 
+    def test_import_questions(self):
+        """Test bulk import validates rows and skips questions already in the bank"""
+        lines = [
+            {'question': 'Which planet has the most moons, as of 2023?', 'answer': 'Saturn', 'category': 'Science', 'difficulty': 3},
+            {'question': '  who DISCOVERED penicillin ', 'answer': 'Alexander Fleming', 'category': 1, 'difficulty': 3},
+            {'question': 'Which river is the longest?', 'answer': 'Nile', 'category': 'Cooking', 'difficulty': 2},
+            {'question': 'Who painted Guernica?', 'answer': 'Picasso', 'category': 2, 'difficulty': 9},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        res = self.client().post('/questions/import?format=ndjson', data=body)
+        data = json.loads(res.data)
+
+        try:
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['rows'], 5)
+            self.assertEqual(data['imported'], 1)
+            self.assertEqual(data['duplicates'], 1)
+            self.assertEqual(data['failed'], 3)
+            self.assertEqual([error['line'] for error in data['errors']], [3, 4, 5])
+            self.assertIn('category', data['errors'][0]['errors'])
+            self.assertIn('difficulty', data['errors'][1]['errors'])
+
+            res = self.client().post('/questions/import?format=ndjson', data=json.dumps(lines[0]))
+            self.assertEqual(json.loads(res.data)['duplicates'], 1)
+        finally:
+            with self.app.app_context():
+                Question.query.filter(Question.question == lines[0]['question']).delete()
+                db.session.commit()
+
+    def import_lines(self, lines):
+        res = self.client().post('/questions/import?format=ndjson', data='\n'.join(json.dumps(line) for line in lines))
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)
+
+    def delete_imported(self, *texts):
+        with self.app.app_context():
+            Question.query.filter(Question.question.in_(texts)).delete(synchronize_session=False)
+            db.session.commit()
+
+    def test_import_difficulty(self):
+        """Test import takes whole-number difficulties, or their digits, and nothing else"""
+        lines = [
+            {'question': 'Difficulty %r?' % difficulty, 'answer': 'Yes', 'category': 1, 'difficulty': difficulty}
+            for difficulty in (True, 1.9, 2.0, '1.9', 'two', None, 2, ' 3 ')
+        ]
+        try:
+            data = self.import_lines(lines)
+            self.assertEqual(data['imported'], 2)
+            self.assertEqual([error['line'] for error in data['errors']], [1, 2, 3, 4, 5, 6])
+            for error in data['errors']:
+                self.assertEqual(list(error['errors']), ['difficulty'])
+        finally:
+            self.delete_imported(*[line['question'] for line in lines])
+
+    def test_import_duplicates_agree(self):
+        """Test a duplicate is found the same way within a batch and against stored questions, non-ASCII text included"""
+        texts = ['Où se trouve la Tour Eiffel ?', 'OÙ SE TROUVE LA TOUR EIFFEL', 'Straße   der „Einheit“?', 'straße der einheit']
+        lines = [{'question': text, 'answer': 'Paris', 'category': 3, 'difficulty': 1} for text in texts]
+        try:
+            together = self.import_lines(lines)
+            self.delete_imported(*texts)
+            apart = {'imported': 0, 'duplicates': 0}
+            for line in lines:
+                data = self.import_lines([line])
+                apart['imported'] += data['imported']
+                apart['duplicates'] += data['duplicates']
+            self.assertEqual((together['imported'], together['duplicates']), (apart['imported'], apart['duplicates']))
+            self.assertEqual(together['imported'] + together['duplicates'], len(lines))
+        finally:
+            self.delete_imported(*texts)
+
+    def test_export_questions(self):
+        """Test export streams every question once, as ndjson or csv"""
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+
+        res = self.client().get('/questions/export?format=ndjson')
+        rows = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(rows), total)
+        self.assertEqual(len({row['id'] for row in rows}), total)
+
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertEqual(res.mimetype, 'text/csv')
+
     def test_question_by_category(self):
         """Test retrieving questions by category"""
         res = self.client().get('/categories/2/questions')
@@ -179,6 +357,91 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['question'])
         self.assertTrue(data['previous_questions'])
+        self.assertNotIn(data['question']['id'], [16, 17])
+        # no quiz_token key: the quiz is rebuilt from previous_questions and nothing is kept
+        self.assertIsNone(data['quiz_token'])
+
+    def test_quiz_session_never_repeats(self):
+        """Test a quiz continued with its token visits every question of the category once"""
+        quizzes_data = {'previous_questions': [], 'quiz_category': {'id': 2}, 'quiz_token': None}
+        seen = []
+        while True:
+            res = self.client().post('/quizzes', json=quizzes_data)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['quiz_token'])
+            if data['question'] is None:
+                break
+            self.assertEqual(data['question']['category'], 2)
+            seen.append(data['question']['id'])
+            quizzes_data['quiz_token'] = data['quiz_token']
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 4)
+        # one session store, but a /quizzes session is not a /quizzes/start one
+        res = self.client().post('/quizzes/%s/next' % quizzes_data['quiz_token'])
+        self.assertEqual(res.status_code, 404)
+
+    def test_422_invalid_quiz(self):
+        """Test if 422 is returned when the quiz category is missing"""
+        res = self.client().post('/quizzes', json={'previous_questions': []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_422_invalid_quiz_token(self):
+        """Test if 422 is returned when the quiz token is neither a string nor null"""
+        for token in (123, ['abc'], {'token': 'abc'}, True):
+            res = self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 0}, 'quiz_token': token})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertFalse(data['success'])
+
+    def test_quiz_session(self):
+        """Test a quiz session from start to finish"""
+        res = self.client().post('/quizzes/start', json={'quiz_category': {'id': 2}, 'length': 3})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['total'], 3)
+        token = data['quiz_token']
+
+        seen = []
+        while True:
+            data = json.loads(self.client().post('/quizzes/%s/next' % token).data)
+            if data['question'] is None:
+                break
+            self.assertNotIn('answer', data['question'])
+            seen.append(data['question']['id'])
+            with self.app.app_context():
+                answer = Question.query.get(data['question']['id']).answer
+            res = self.client().post('/quizzes/%s/answer' % token, json={'answer': answer})
+            self.assertTrue(json.loads(res.data)['correct'])
+
+        self.assertEqual(len(set(seen)), 3)
+        res = self.client().post('/quizzes/%s/finish' % token)
+        data = json.loads(res.data)
+        self.assertEqual(data['score'], {'answered': 3, 'correct': 3, 'total': 3})
+        self.assertEqual(self.client().post('/quizzes/%s/next' % token).status_code, 404)
+
+    def test_422_quiz_answer_without_question(self):
+        """Test if 422 is returned when answering before asking for a question"""
+        token = json.loads(self.client().post('/quizzes/start', json={'quiz_category': {'id': 0}}).data)['quiz_token']
+        res = self.client().post('/quizzes/%s/answer' % token, json={'answer': 'Agra'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_questions_query_budget(self):
+        """Test listing questions stays within its query budget"""
+        profiler = self.app.extensions.get('query_profiler')
+        if profiler is None:
+            self.skipTest('flask_query_profiler is not installed')
+        with profiler.budget(3):
+            res = self.client().get('/questions')
+        self.assertEqual(res.status_code, 200)
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -6,10 +6,19 @@ from flask_cors import CORS
 
 from .database.models import db_drop_and_create_all, setup_db, Drink
 from .auth.auth import AuthError, requires_auth
+try:
+    from flask_query_profiler import QueryProfiler
+except ImportError:
+    # optional, see /QueryProfiler
+    QueryProfiler = None
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+# per-request query counts and Server-Timing headers; debug runs only unless set
+app.config.setdefault('QUERY_PROFILER', app.debug)
+if QueryProfiler is not None and app.config['QUERY_PROFILER']:
+    QueryProfiler(app)
 
 '''
 @TODO uncomment the following line to initialize the datbase